@@ -0,0 +1,27 @@
+from constants import *
+from decimal import Decimal
+
+# Amounts are exact integers in base units of their asset: wei for ETH, the smallest unit for tokens
+#   arithmetic on them is plain integer arithmetic, conversions below are only for display and USD math
+
+
+def parseUnits(quantity, decimals=WEI_DECIMALS):
+    # Decimal string in whole units (e.g. "1.5" ETH) to base units, exact
+    base_units = Decimal(quantity).scaleb(decimals)
+    if base_units != base_units.to_integral_value():
+        raise Exception('{} has more than {} decimals'.format(quantity, decimals))
+
+    return int(base_units)
+
+
+def toUnits(base_units, decimals=WEI_DECIMALS):
+    # Whole units as float, for prices and display
+    return base_units / 10 ** decimals
+
+
+def formatUnits(base_units, decimals=WEI_DECIMALS):
+    # Exact decimal string in whole units, without trailing zeros
+    sign = '-' if base_units < 0 else ''
+    whole, fraction = divmod(abs(base_units), 10 ** decimals)
+    fraction_str = str(fraction).rjust(decimals, '0').rstrip('0') if decimals else ''
+    return '{}{}{}'.format(sign, whole, '.' + fraction_str if fraction_str else '')
@@ -1,86 +1,124 @@
+import fileIO
 import priceIO
+from amounts import formatUnits, toUnits
 from constants import *
+from datetime import *
+from lotStore import Ledger, loadLedger
+import reportWriter
+import calendar
+import itertools
 
 
-def _reduceCostBasisByEth(cost_basis, eth, cost_method):
+def _reduceCostBasisByEth(lot_store, eth):
     if eth > 0:
         raise Exception('cannot have transfer that costs less than nothing')
 
     # eth < 0
-    # Decrease in ETH = reduce cost
+    # Decrease in ETH = reduce cost, lots are consumed in the order of the cost method
     else:
-        # Sort by price
-        # TODO: support more cost basis types, FIFO, LIFO, average cost
-        match cost_method:
-            case _:     # COST_METHOD_HIFO
-                # sort transactions by descending cost
-                cost_basis.sort(reverse=True, key=SORT_FUNC_BY_PRICE)
-
-        cost_reduced = []
-        eth_cost = -eth
-        # Reduce cost from current item, until all cost is accounted and deducted
-        for cost_i in cost_basis:
-            # current item enough to account for cost
-            if eth_cost <= cost_i['amount']:
-                cost_reduced.append({
-                    'amount': eth_cost,
-                    'unit_price_usd': cost_i['unit_price_usd']
-                })
-                cost_i['amount'] -= eth_cost
-                eth_cost = 0
-                break
-
-            # current item fully exhausted by remaining cost
-            else:
-                cost_reduced.append({
-                    'amount': cost_i['amount'],
-                    'unit_price_usd': cost_i['unit_price_usd']
-                })
-                eth_cost -= cost_i['amount']
-                cost_i['amount'] = 0
-
-        # All cost items exhausted, but still remaining cost
-        if eth_cost != 0:
-            raise Exception('Not enough ETH to spend')
-
-        # remove cost items with 0 amount left
-        cost_basis = list(filter(lambda c: c['amount'] > 0, cost_basis))
-
-    return cost_basis, cost_reduced
-
-
-def _increaseCostBasisToEth(cost_basis, cost, cost_method):
+        return lot_store.consume(-eth)
+
+
+def _increaseCostBasisToEth(lot_store, cost):
     if cost < 0:
         raise Exception('cannot increase cost basis by negative amount')
 
-    # eth < 0
+    # increase average cost of ETH
     else:
-        # Sort by price
-        # TODO: support more cost basis types, FIFO, LIFO, average cost
-        match cost_method:
-            # COST_METHOD_HIFO
-            case _:
-                # sort transactions by descending cost
-                cost_basis.sort(reverse=True, key=SORT_FUNC_BY_PRICE)
-
-        # remove cost items with 0 amount left
-        cost_basis = list(filter(lambda c: c['amount'] > 0, cost_basis))
-        # increase average cost of ETH
-        cost_basis[0]['unit_price_usd'] += cost / cost_basis[0]['amount']
-
-    return cost_basis
+        lot_store.increaseCost(cost)
+
+
+def _balanceState(timestamp, ledger):
+    # balance and USD cost are kept up to date by the lot stores, snapshot of their lots is O(1)
+    #   ETH is at the top level, other assets of the ledger by asset
+    lot_store = ledger.lotStore(ASSET_ETH)
+    return {
+        'timestamp': timestamp,
+        'cost_method': ledger.cost_method,
+        'remaining_balance': lot_store.balance,
+        'unit_price_usd_avg': lot_store.cost_usd / toUnits(lot_store.balance) if lot_store.balance else 0.0,
+        'cost_basis': lot_store.snapshot(),
+        'assets': {asset: asset_lot_store.snapshot() for asset, asset_lot_store in ledger.lot_stores.items()
+                   if asset != ASSET_ETH},
+        'nft_quantity': ledger.nfts.quantity,
+        'nft_cost_usd': ledger.nfts.cost_usd,
+    }
 
 
-def _calculateTaxEvent(cost_basis, price_sold):
+def _calculateTaxEvent(cost_basis, price_sold, asset=ASSET_ETH, decimals=WEI_DECIMALS):
+    # amounts are in base units of the asset, prices in USD per whole unit
     tax_base = proceeds = 0
     for cost_i in cost_basis:
-        tax_base += cost_i['unit_price_usd'] * cost_i['amount']
-        proceeds += price_sold * cost_i['amount']
+        amount = toUnits(cost_i['amount'], decimals)
+        tax_base += cost_i['unit_price_usd'] * amount
+        proceeds += price_sold * amount
+
+    return {'asset': asset, 'cost_basis': tax_base, 'proceeds': proceeds}
+
+
+def _applyTokens(ledger, txn):
+    # ERC-20 tokens (and WETH) in and out of my wallets, each asset in its own lot store
+    #   tokens received are added at spot price, tokens sent are consumed in the order of the cost method,
+    #   as tax events, amounts sent beyond the tracked balance (e.g. rebasing tokens) are disposed at no cost basis
+    tax_events = []
+    for token in txn['tokens']:
+        lot_store = ledger.lotStore(token['asset'], token['decimals'])
+        price = priceIO.getAssetPrice(token['asset'], txn['timestamp'])
+        if token['amount'] > 0:
+            lot_store.add(token['amount'], price)
+        else:
+            amount = -token['amount']
+            tracked_amount = min(amount, lot_store.balance)
+            cost_reduced = lot_store.consume(tracked_amount)
+            if amount > tracked_amount:
+                cost_reduced.append({'amount': amount - tracked_amount, 'unit_price_usd': 0.0})
+            tax_events.append(_calculateTaxEvent(cost_reduced, price, token['asset'], token['decimals']))
+
+        reportWriter.emit('asset_balances', _assetBalanceRecord(txn, token, lot_store))
+
+    return tax_events
+
+
+def _nftAsset(nft):
+    return '{}-{}'.format(nft['contract'], nft['id'])
+
+
+def _incomingNfts(txn):
+    return [nft for nft in txn.get('nfts', []) if nft['quantity'] > 0]
+
+
+def _outgoingNfts(txn):
+    return [nft for nft in txn.get('nfts', []) if nft['quantity'] < 0]
+
+
+def _removeNfts(nft_inventory, nfts):
+    # Cost basis of outgoing NFTs, as they leave the inventory
+    return [nft_inventory.remove(nft['contract'], nft['id'], -nft['quantity']) for nft in nfts]
+
+
+def _disposeNfts(nft_inventory, nfts, proceeds):
+    # Outgoing NFTs as tax events, proceeds are split over them by quantity
+    quantity = -sum(nft['quantity'] for nft in nfts)
+    return [{'asset': _nftAsset(nft), 'cost_basis': cost_usd, 'proceeds': proceeds * -nft['quantity'] / quantity}
+            for nft, cost_usd in zip(nfts, _removeNfts(nft_inventory, nfts))]
 
-    return {'cost_basis': tax_base, 'proceeds': proceeds}
 
+def _tokenValue(token, timestamp):
+    # USD value of the amount of an ERC-20 token moved, at spot price
+    return toUnits(abs(token['amount']), token['decimals']) * priceIO.getAssetPrice(token['asset'], timestamp)
 
-def _matchCoinbaseTransferPair(txn_by_coinbase, txn_from_coinbase, prev_state, cost_method):
+
+def _incomingTokensValue(txn):
+    # USD value of ERC-20 tokens received, at spot price
+    return sum(_tokenValue(token, txn['timestamp']) for token in txn.get('tokens', []) if token['amount'] > 0)
+
+
+def _outgoingTokensValue(txn):
+    # USD value of ERC-20 tokens (and WETH) sent, at spot price, the proceeds of their disposal (see _applyTokens)
+    return sum(_tokenValue(token, txn['timestamp']) for token in txn.get('tokens', []) if token['amount'] < 0)
+
+
+def _matchCoinbaseTransferPair(txn_by_coinbase, txn_from_coinbase, ledger):
     # two transactions should be 1 initiated by Coinbase, 1 received from Coinbase
     if txn_from_coinbase['type'] != 'transfer_from_coinbase':
         raise Exception('adjacent coinbase transfers are not matching pair')
@@ -93,7 +131,8 @@ def _matchCoinbaseTransferPair(txn_by_coinbase, txn_from_coinbase, prev_state, c
 
     # implied transaction cost = difference in sent amount vs received amount
     transfer_cost_eth = txn_from_coinbase['ETH']['amount'] - txn_by_coinbase['ETH']['amount']
-    cost_basis, cost_reduced = _reduceCostBasisByEth(prev_state['cost_basis'], transfer_cost_eth, cost_method)
+    lot_store = ledger.lotStore(ASSET_ETH)
+    cost_reduced = _reduceCostBasisByEth(lot_store, transfer_cost_eth)
 
     # order of operation:
     #   1. Sold ETH at spot price (Tax Event)
@@ -101,53 +140,173 @@ def _matchCoinbaseTransferPair(txn_by_coinbase, txn_from_coinbase, prev_state, c
     #   3. Value of 2 is added to ETH cost basis because it is necessary expense to continue investing with ETH
     timestamp = max(txn_by_coinbase['timestamp'], txn_from_coinbase['timestamp'])
     tax_event = _calculateTaxEvent(cost_reduced, priceIO.getEthPrice(timestamp))
-    new_cost_basis = _increaseCostBasisToEth(cost_basis, tax_event['proceeds'], cost_method)
-
-    remaining_balance = sum([x['amount'] for x in new_cost_basis])
-    state = {
-        'timestamp': min(txn_by_coinbase['timestamp'], txn_from_coinbase['timestamp']),
-        'remaining_balance': remaining_balance,
-        'unit_price_usd_avg': sum([x['unit_price_usd'] * x['amount'] for x in new_cost_basis]) / remaining_balance,
-        'cost_basis': new_cost_basis,
-    }
+    _increaseCostBasisToEth(lot_store, tax_event['proceeds'])
+
+    state = _balanceState(min(txn_by_coinbase['timestamp'], txn_from_coinbase['timestamp']), ledger)
 
     return state, tax_event
 
 
-def analyzeEth(eth_txns_summary, cost_method=COST_METHOD_HIFO):
+def _balanceRecord(txn, state):
+    return {
+        'timestamp': state['timestamp'],
+        'cost_method': state['cost_method'],
+        'remaining_balance': formatUnits(state['remaining_balance']),
+        'unit_price_usd_avg': state['unit_price_usd_avg'],
+        'cost_usd': state['cost_basis'].cost_usd,
+        'nft_quantity': state['nft_quantity'],
+        'nft_cost_usd': state['nft_cost_usd'],
+        'description': txn['description'],
+    }
+
+
+def _assetBalanceRecord(txn, token, lot_store):
+    return {
+        'timestamp': txn['timestamp'],
+        'cost_method': lot_store.cost_method,
+        'asset': token['asset'],
+        'symbol': token['symbol'],
+        'remaining_balance': formatUnits(lot_store.balance, lot_store.decimals),
+        'cost_usd': lot_store.cost_usd,
+        'description': txn['description'],
+    }
+
+
+def _taxEventRecord(txn, tax_event, cost_method):
+    return {
+        'timestamp': txn['timestamp'],
+        'cost_method': cost_method,
+        'type': txn['type'],
+        'asset': tax_event['asset'],
+        'cost_basis': tax_event['cost_basis'],
+        'proceeds': tax_event['proceeds'],
+        'description': txn['description'],
+    }
+
+
+def _comparisonRecord(states):
+    # Cost basis and realized gains of every cost method side by side, balances and proceeds are the same for all
+    first_state = next(iter(states.values()))
+    record = {
+        'timestamp': first_state['timestamp'],
+        'remaining_balance': formatUnits(first_state['remaining_balance']),
+        'proceeds': sum(tax_event['proceeds'] for tax_event in first_state['tax_events']),
+    }
+    for cost_method, state in states.items():
+        cost_basis = sum(tax_event['cost_basis'] for tax_event in state['tax_events'])
+        record[cost_method.lower() + '_cost_usd'] = state['cost_basis'].cost_usd
+        record[cost_method.lower() + '_unit_price_usd_avg'] = state['unit_price_usd_avg']
+        record[cost_method.lower() + '_tax_cost_basis'] = cost_basis
+        record[cost_method.lower() + '_gain'] = record['proceeds'] - cost_basis
+
+    return record
+
+
+def prefetchPrices(eth_txns_summary):
+    # Resolve price of every asset of every transaction before analysis, analyzeEth then only does in-memory lookups
+    timestamps_by_asset = {ASSET_ETH: [txn['timestamp'] for txn in eth_txns_summary]}
+    for txn in eth_txns_summary:
+        if txn['type'] != 'ignore':
+            for token in txn.get('tokens', []):
+                timestamps_by_asset.setdefault(token['asset'], []).append(txn['timestamp'])
+
+    return sum(priceIO.prefetchAssetPrices(asset, timestamps) for asset, timestamps in timestamps_by_asset.items())
+
+
+def iterPrefetchPrices(eth_txns_summary, window=PRICE_PREFETCH_WINDOW):
+    # Streaming counterpart of prefetchPrices, prices are resolved for a window of transactions ahead of analysis
+    eth_txns_summary = iter(eth_txns_summary)
+    while True:
+        txns = list(itertools.islice(eth_txns_summary, window))
+        if not txns:
+            return
+        prefetchPrices(txns)
+        yield from txns
+
+
+def createCheckpoint(timestamp, ledger, temp_coinbase_transfers, inputs=None):
+    # Analysis state after every transaction up to the timestamp, opening state for a later analysis period
+    #   of the same inputs (wallets and data files, see fileIO.getCheckpointInputs)
+    return {
+        'version': CHECKPOINT_VERSION,
+        'timestamp': timestamp,
+        'inputs': inputs,
+        'ledger': ledger.dump(),
+        'coinbase_transfers': list(temp_coinbase_transfers),
+    }
+
+
+def openCheckpoint(checkpoint, cost_method=COST_METHOD_HIFO):
+    # Ledger and unmatched coinbase transfers to continue analysis from, empty without a checkpoint
+    if checkpoint is None:
+        return Ledger(cost_method), []
+
+    return loadLedger(checkpoint['ledger']), list(checkpoint['coinbase_transfers'])
+
+
+def yearEndTimestamps(start_timestamp, end_timestamp):
+    # Last second (UTC) of every year ending within the time period
+    first_year = datetime.utcfromtimestamp(max(start_timestamp, 0)).year
+    year_ends = (calendar.timegm((year, 12, 31, 23, 59, 59)) for year in itertools.count(first_year))
+    return [year_end for year_end in itertools.takewhile(lambda t: t <= end_timestamp, year_ends)
+            if year_end >= start_timestamp]
+
+
+def iterCheckpointTxns(eth_txns_summary, ledger, temp_coinbase_transfers, checkpoint_timestamps, checkpoint_f,
+                       inputs=None):
+    # Pass transactions on to analysis, checkpoints of the analysis state are saved at the given timestamps
+    #   analysis only pulls a transaction once the previous one is analyzed, so when the first transaction after
+    #   a timestamp is pulled, the ledger and unmatched coinbase transfers are the state at that timestamp
+    #   timestamps before the first transaction are skipped, resuming from them would replay nothing less
+    checkpoint_timestamps = iter(sorted(checkpoint_timestamps))
+    checkpoint_timestamp = next(checkpoint_timestamps, None)
+    is_analyzing = False
+    for txn in eth_txns_summary:
+        while checkpoint_timestamp is not None and txn['timestamp'] > checkpoint_timestamp:
+            if is_analyzing:
+                fileIO.cacheCheckpoint(createCheckpoint(checkpoint_timestamp, ledger, temp_coinbase_transfers,
+                                                        inputs), checkpoint_f)
+            checkpoint_timestamp = next(checkpoint_timestamps, None)
+        is_analyzing = True
+        yield txn
+
+    # no more transactions, the final state is the state at every remaining timestamp
+    while checkpoint_timestamp is not None:
+        fileIO.cacheCheckpoint(createCheckpoint(checkpoint_timestamp, ledger, temp_coinbase_transfers, inputs),
+                               checkpoint_f)
+        checkpoint_timestamp = next(checkpoint_timestamps, None)
+
+
+def iterAnalyzeEth(eth_txns_summary, cost_method=COST_METHOD_HIFO, ledger=None, temp_coinbase_transfers=None):
     # Track 2 key metrics: balance and tax events
-    #   Balance needs to be tracked as "state" that evolve over the timeline
+    #   Balance needs to be tracked as "state" that evolve over the timeline, yielded as each state is reached
     #   Tax Events needs previous state and current transaction
-    balances = []
+    #   ETH, tokens and NFTs are tracked together in a single pass, in a ledger of lot stores by asset
+    #   and an inventory of NFTs, cost of acquiring NFTs (ETH paid and gas) is allocated to them
+    #   analysis continues from the given ledger and unmatched coinbase transfers (see openCheckpoint),
+    #   which are updated in place, each state carries the tax events since the previous state
     tax_events = []
-    prev_state = {
-        'timestamp': 0,
-        'balance': 0.0,
-        'cost_basis': [],
-    }
-    temp_coinbase_transfers = []
+    # tax events since the previous state, they are carried by the next state
+    state_tax_events = 0
+    # Open lots of each asset, ordered for consumption by the cost method
+    if ledger is None:
+        ledger = Ledger(cost_method)
+    lot_store = ledger.lotStore(ASSET_ETH)
+    nft_inventory = ledger.nfts
+    if temp_coinbase_transfers is None:
+        temp_coinbase_transfers = []
 
     for txn in eth_txns_summary:
         state = {}
-        cost_basis = prev_state['cost_basis']
+        txn_tax_events = len(tax_events)
 
         match txn['type']:
             # Purchase ETH (With USD)
             case 'buy':
                 # Add new purchased amount with cost basis (including gas/fees)
-                cost_basis.append({
-                    'amount': txn['ETH']['amount'],
-                    'unit_price_usd': priceIO.getEthPrice(txn['timestamp'])
-                })
+                lot_store.add(txn['ETH']['amount'], priceIO.getEthPrice(txn['timestamp']))
                 # NOT tax event
-                remaining_balance = sum([x['amount'] for x in cost_basis])
-                state = {
-                    'timestamp': txn['timestamp'],
-                    'remaining_balance': remaining_balance,
-                    'unit_price_usd_avg':
-                        sum([x['unit_price_usd'] * x['amount'] for x in cost_basis]) / remaining_balance,
-                    'cost_basis': cost_basis,
-                }
+                state = _balanceState(txn['timestamp'], ledger)
 
             # Transfer to own wallet, transaction initiated by Coinbase
             case 'transfer_by_coinbase':
@@ -157,7 +316,7 @@ def analyzeEth(eth_txns_summary, cost_method=COST_METHOD_HIFO):
                 # if something already in the queue, try to match it with current transaction
                 else:
                     txn_pair = temp_coinbase_transfers.pop(0)
-                    state, tax_event = _matchCoinbaseTransferPair(txn, txn_pair, prev_state, cost_method)
+                    state, tax_event = _matchCoinbaseTransferPair(txn, txn_pair, ledger)
                     tax_events.append(tax_event)
 
             case 'transfer_from_coinbase':
@@ -167,171 +326,162 @@ def analyzeEth(eth_txns_summary, cost_method=COST_METHOD_HIFO):
                 # if something already in the queue, try to match it with current transaction
                 else:
                     txn_pair = temp_coinbase_transfers.pop(0)
-                    state, tax_event = _matchCoinbaseTransferPair(txn_pair, txn, prev_state, cost_method)
+                    state, tax_event = _matchCoinbaseTransferPair(txn_pair, txn, ledger)
                     tax_events.append(tax_event)
 
             # TODO handle ronin/polygon tokens
             case 'transfer' | 'transfer_to_ronin' | 'transfer_to_polygon':
-                new_cost_basis, cost_reduced = _reduceCostBasisByEth(cost_basis, -txn['gas']['amount'],
-                                                                     cost_method)
+                cost_reduced = _reduceCostBasisByEth(lot_store, -txn['gas']['amount'])
                 # the reduced cost is used to pay expense, thus increasing USD cost of remaining ETH
                 tax_event = _calculateTaxEvent(cost_reduced, priceIO.getEthPrice(txn['timestamp']))
                 tax_events.append(tax_event)
-                new_cost_basis = _increaseCostBasisToEth(new_cost_basis, tax_event['proceeds'], cost_method)
+                _increaseCostBasisToEth(lot_store, tax_event['proceeds'])
 
                 # NOT tax event
-                remaining_balance = sum([x['amount'] for x in new_cost_basis])
-                state = {
-                    'timestamp': txn['timestamp'],
-                    'remaining_balance': remaining_balance,
-                    'unit_price_usd_avg':
-                        sum([x['unit_price_usd'] * x['amount'] for x in new_cost_basis]) / remaining_balance,
-                    'cost_basis': new_cost_basis,
-                }
+                state = _balanceState(txn['timestamp'], ledger)
 
             case 'gift':
                 eth_reduction = txn['ETH']['amount']
-                new_cost_basis, _ = _reduceCostBasisByEth(cost_basis, -eth_reduction, cost_method)
+                _reduceCostBasisByEth(lot_store, -eth_reduction)
                 # gift is NOT tax event, but cost is
                 gas_cost = txn['gas']['amount'] if 'amount' in txn['gas'] else 0
                 if gas_cost:
-                    new_cost_basis, cost_reduced = _reduceCostBasisByEth(new_cost_basis, -gas_cost, cost_method)
+                    cost_reduced = _reduceCostBasisByEth(lot_store, -gas_cost)
                     tax_event = _calculateTaxEvent(cost_reduced, priceIO.getEthPrice(txn['timestamp']))
                     tax_events.append(tax_event)
-                    new_cost_basis = _increaseCostBasisToEth(new_cost_basis, tax_event['proceeds'], cost_method)
-                else:
-                    new_cost_basis = cost_basis
+                    _increaseCostBasisToEth(lot_store, tax_event['proceeds'])
 
-                remaining_balance = sum([x['amount'] for x in new_cost_basis])
-                state = {
-                    'timestamp': txn['timestamp'],
-                    'remaining_balance': remaining_balance,
-                    'unit_price_usd_avg':
-                        sum([x['unit_price_usd'] * x['amount'] for x in new_cost_basis]) / remaining_balance,
-                    'cost_basis': new_cost_basis
-                }
+                state = _balanceState(txn['timestamp'], ledger)
 
             # could be receiving gift or raffle returns, does not make a difference
             case 'receive_gift':
-                cost_basis.append({
-                    'amount': txn['ETH']['amount'],
-                    'unit_price_usd': priceIO.getEthPrice(txn['timestamp'])
-                })
+                lot_store.add(txn['ETH']['amount'], priceIO.getEthPrice(txn['timestamp']))
 
                 # cost is tax event
                 gas_cost = txn['gas']['amount'] if 'amount' in txn['gas'] else 0
                 if gas_cost:
-                    cost_basis, cost_reduced = _reduceCostBasisByEth(cost_basis, -gas_cost, cost_method)
+                    cost_reduced = _reduceCostBasisByEth(lot_store, -gas_cost)
                     tax_event = _calculateTaxEvent(cost_reduced, priceIO.getEthPrice(txn['timestamp']))
                     tax_events.append(tax_event)
-                    new_cost_basis = _increaseCostBasisToEth(cost_basis, tax_event['proceeds'], cost_method)
-                else:
-                    new_cost_basis = cost_basis
+                    _increaseCostBasisToEth(lot_store, tax_event['proceeds'])
 
-                remaining_balance = sum([x['amount'] for x in new_cost_basis])
-                state = {
-                    'timestamp': txn['timestamp'],
-                    'remaining_balance': remaining_balance,
-                    'unit_price_usd_avg':
-                        sum([x['unit_price_usd'] * x['amount'] for x in new_cost_basis]) / remaining_balance,
-                    'cost_basis': new_cost_basis
-                }
+                state = _balanceState(txn['timestamp'], ledger)
 
             case 'misc_expense':
                 eth_reduction = txn['ETH']['amount'] + (txn['gas']['amount'] if 'amount' in txn['gas'] else 0)
-                new_cost_basis, cost_reduced = _reduceCostBasisByEth(cost_basis, -eth_reduction, cost_method)
+                cost_reduced = _reduceCostBasisByEth(lot_store, -eth_reduction)
                 # the reduced cost is used to pay expense, thus increasing USD cost of remaining ETH
                 tax_event = _calculateTaxEvent(cost_reduced, priceIO.getEthPrice(txn['timestamp']))
                 tax_events.append(tax_event)
-                new_cost_basis = _increaseCostBasisToEth(new_cost_basis, tax_event['proceeds'], cost_method)
+                _increaseCostBasisToEth(lot_store, tax_event['proceeds'])
 
-                remaining_balance = sum([x['amount'] for x in new_cost_basis])
-                state = {
-                    'timestamp': txn['timestamp'],
-                    'remaining_balance': remaining_balance,
-                    'unit_price_usd_avg':
-                        sum([x['unit_price_usd'] * x['amount'] for x in new_cost_basis]) / remaining_balance,
-                    'cost_basis': new_cost_basis
-                }
+                state = _balanceState(txn['timestamp'], ledger)
 
             case 'failed_txn':
                 eth_reduction = txn['gas']['amount']
-                new_cost_basis, cost_reduced = _reduceCostBasisByEth(cost_basis, -eth_reduction, cost_method)
+                cost_reduced = _reduceCostBasisByEth(lot_store, -eth_reduction)
                 # the reduced cost is used to pay expense, thus increasing USD cost of remaining ETH
                 tax_event = _calculateTaxEvent(cost_reduced, priceIO.getEthPrice(txn['timestamp']))
                 tax_events.append(tax_event)
-                new_cost_basis = _increaseCostBasisToEth(new_cost_basis, tax_event['proceeds'], cost_method)
+                _increaseCostBasisToEth(lot_store, tax_event['proceeds'])
 
                 # TODO add cost to contract instead
-                remaining_balance = sum([x['amount'] for x in new_cost_basis])
-                state = {
-                    'timestamp': txn['timestamp'],
-                    'remaining_balance': remaining_balance,
-                    'unit_price_usd_avg':
-                        sum([x['unit_price_usd'] * x['amount'] for x in new_cost_basis]) / remaining_balance,
-                    'cost_basis': new_cost_basis
-                }
-
-            case 'transfer_nft' | 'send_nft':
+                state = _balanceState(txn['timestamp'], ledger)
+
+            case 'transfer_nft':
                 eth_reduction = txn['gas']['amount'] if 'amount' in txn['gas'] else 0
-                new_cost_basis, cost_reduced = _reduceCostBasisByEth(cost_basis, -eth_reduction, cost_method)
+                cost_reduced = _reduceCostBasisByEth(lot_store, -eth_reduction)
 
                 tax_event = _calculateTaxEvent(cost_reduced, priceIO.getEthPrice(txn['timestamp']))
                 tax_events.append(tax_event)
 
-                # TODO transfer cost to NFTs
-                remaining_balance = sum([x['amount'] for x in new_cost_basis])
-                state = {
-                    'timestamp': txn['timestamp'],
-                    'remaining_balance': remaining_balance,
-                    'unit_price_usd_avg':
-                        sum([x['unit_price_usd'] * x['amount'] for x in new_cost_basis]) / remaining_balance,
-                    'cost_basis': new_cost_basis
-                }
-
-            case 'buy_nft' | 'approve_contract' | 'exchange' | 'wrap_ETH':
+                # gas of moving NFTs between wallets is carried by the NFTs moved, those held
+                nft_keys = dict.fromkeys((t['contract'].lower(), t['id'])
+                                         for t in txn['NFTs']['ERC-721'] + txn['NFTs']['ERC-1155'])
+                held_keys = [key for key in nft_keys if nft_inventory.holds(*key)]
+                for contract, token_id in held_keys:
+                    nft_inventory.increaseCost(contract, token_id, tax_event['proceeds'] / len(held_keys))
+                state = _balanceState(txn['timestamp'], ledger)
+
+            case 'send_nft' | 'gift_nft':
+                eth_reduction = txn['gas']['amount'] if 'amount' in txn['gas'] else 0
+                cost_reduced = _reduceCostBasisByEth(lot_store, -eth_reduction)
+
+                tax_event = _calculateTaxEvent(cost_reduced, priceIO.getEthPrice(txn['timestamp']))
+                tax_events.append(tax_event)
+
+                # NFTs given away leave the inventory with their cost, NOT tax event
+                _removeNfts(nft_inventory, _outgoingNfts(txn))
+                state = _balanceState(txn['timestamp'], ledger)
+
+            case 'buy_nft' | 'exchange':
                 eth_reduction = (txn['ETH']['amount'] if 'amount' in txn['ETH'] else 0) + \
                                 (txn['gas']['amount'] if 'amount' in txn['gas'] else 0)
-                new_cost_basis, cost_reduced = _reduceCostBasisByEth(cost_basis, -eth_reduction, cost_method)
+                cost_reduced = _reduceCostBasisByEth(lot_store, -eth_reduction)
 
                 tax_event = _calculateTaxEvent(cost_reduced, priceIO.getEthPrice(txn['timestamp']))
                 tax_events.append(tax_event)
 
-                # TODO handle outbound NFT costs (exchange)
-                # TODO transfer cost to NFTs
-                remaining_balance = sum([x['amount'] for x in new_cost_basis])
-                state = {
-                    'timestamp': txn['timestamp'],
-                    'remaining_balance': remaining_balance,
-                    'unit_price_usd_avg':
-                        sum([x['unit_price_usd'] * x['amount'] for x in new_cost_basis]) / remaining_balance,
-                    'cost_basis': new_cost_basis
-                }
-
-            case 'sell_nft' | 'unwrap_ETH':
+                # ETH paid (with gas), value of tokens paid (e.g. WETH offers) and cost of NFTs exchanged for them
+                #   is allocated to NFTs received
+                incoming_nfts = _incomingNfts(txn)
+                if incoming_nfts:
+                    outgoing_cost = sum(_removeNfts(nft_inventory, _outgoingNfts(txn))) + _outgoingTokensValue(txn)
+                    nft_inventory.addAll(incoming_nfts, tax_event['proceeds'] + outgoing_cost)
+                # NFTs exchanged for tokens only are sold for the value of the tokens
+                elif _outgoingNfts(txn):
+                    tax_events += _disposeNfts(nft_inventory, _outgoingNfts(txn), _incomingTokensValue(txn))
+
+                state = _balanceState(txn['timestamp'], ledger)
+
+            case 'approve_contract' | 'wrap_ETH':
+                eth_reduction = (txn['ETH']['amount'] if 'amount' in txn['ETH'] else 0) + \
+                                (txn['gas']['amount'] if 'amount' in txn['gas'] else 0)
+                cost_reduced = _reduceCostBasisByEth(lot_store, -eth_reduction)
+
+                tax_event = _calculateTaxEvent(cost_reduced, priceIO.getEthPrice(txn['timestamp']))
+                tax_events.append(tax_event)
+
+                state = _balanceState(txn['timestamp'], ledger)
+
+            case 'sell_nft':
+                # Add new purchased amount with cost basis (including gas/fees)
+                eth_price = priceIO.getEthPrice(txn['timestamp'])
+                lot_store.add(txn['ETH']['amount'], eth_price)
+                proceeds = toUnits(txn['ETH']['amount']) * eth_price
+
+                # gas of the sale reduces its proceeds
+                gas_cost = txn['gas']['amount'] if 'amount' in txn['gas'] else 0
+                if gas_cost:
+                    cost_reduced = _reduceCostBasisByEth(lot_store, -gas_cost)
+                    tax_event = _calculateTaxEvent(cost_reduced, eth_price)
+                    tax_events.append(tax_event)
+                    proceeds -= tax_event['proceeds']
+
+                tax_events += _disposeNfts(nft_inventory, _outgoingNfts(txn), proceeds)
+                state = _balanceState(txn['timestamp'], ledger)
+
+            case 'unwrap_ETH':
                 # Add new purchased amount with cost basis (including gas/fees)
-                cost_basis.append({
-                    'amount': txn['ETH']['amount'],
-                    'unit_price_usd': priceIO.getEthPrice(txn['timestamp'])
-                })
-
-                # TODO handle NFT sale tax event
-                remaining_balance = sum([x['amount'] for x in cost_basis])
-                state = {
-                    'timestamp': txn['timestamp'],
-                    'remaining_balance': remaining_balance,
-                    'unit_price_usd_avg':
-                        sum([x['unit_price_usd'] * x['amount'] for x in cost_basis]) / remaining_balance,
-                    'cost_basis': cost_basis,
-                }
+                lot_store.add(txn['ETH']['amount'], priceIO.getEthPrice(txn['timestamp']))
+
+                state = _balanceState(txn['timestamp'], ledger)
 
             case 'burn_nft':
-                # TODO implement this
-                pass
+                eth_reduction = (txn['ETH']['amount'] if 'amount' in txn['ETH'] else 0) + \
+                                (txn['gas']['amount'] if 'amount' in txn['gas'] else 0)
+                if eth_reduction:
+                    cost_reduced = _reduceCostBasisByEth(lot_store, -eth_reduction)
+                    tax_events.append(_calculateTaxEvent(cost_reduced, priceIO.getEthPrice(txn['timestamp'])))
+
+                # NFTs burned are disposed for nothing
+                tax_events += _disposeNfts(nft_inventory, _outgoingNfts(txn), 0.0)
+                state = _balanceState(txn['timestamp'], ledger)
 
             case 'receive_nft_gift':
-                # TODO implement this
-                pass
+                # NFTs received for free have no cost basis, NOT tax event
+                nft_inventory.addAll(_incomingNfts(txn), 0.0)
+                state = _balanceState(txn['timestamp'], ledger)
 
             case 'ignore':
                 pass
@@ -339,10 +489,54 @@ def analyzeEth(eth_txns_summary, cost_method=COST_METHOD_HIFO):
             case _:
                 raise Exception('Unknown transaction type {} cannot be processed'.format(txn['type']))
 
+        # tokens of scam transactions are not tracked
+        if txn.get('tokens') and txn['type'] != 'ignore':
+            tax_events += _applyTokens(ledger, txn)
+            state = _balanceState(txn['timestamp'], ledger)
+
+        for tax_event in tax_events[txn_tax_events:]:
+            reportWriter.emit('tax_events', _taxEventRecord(txn, tax_event, ledger.cost_method))
+
         if state:
-            print(txn['description'])
-            print(state['remaining_balance'])
-            balances.append(state)
-            prev_state = state
+            reportWriter.emit('balances', _balanceRecord(txn, state),
+                              '{}\n{}'.format(txn['description'], formatUnits(state['remaining_balance'])),
+                              reportWriter.LEVEL_DEBUG)
+            state['tax_events'] = tax_events[state_tax_events:]
+            state_tax_events = len(tax_events)
+            yield state
 
-    return balances
+
+def analyzeEth(eth_txns_summary, cost_method=COST_METHOD_HIFO):
+    return list(iterAnalyzeEth(eth_txns_summary, cost_method))
+
+
+def iterCompareCostMethods(eth_txns_summary, ledgers, temp_coinbase_transfers, checkpoint_timestamps=(),
+                           checkpoint_f=None, checkpoint_inputs=None):
+    # Analyze one stream of transactions with several cost methods at once, a ledger (and unmatched coinbase
+    #   transfers) for each method, keyed by cost method, states of every method are yielded side by side
+    #   the stream is described and priced once, then teed to an analysis per method,
+    #   every method reaches a state on the same transactions, so analyses advance in lockstep and only the
+    #   transactions between two states are buffered
+    #   checkpoints are saved per method, each after its own analysis (see iterCheckpointTxns)
+    cost_methods = list(ledgers)
+    analyses = []
+    for cost_method, txns in zip(cost_methods, itertools.tee(eth_txns_summary, len(cost_methods))):
+        if checkpoint_f is not None:
+            txns = iterCheckpointTxns(txns, ledgers[cost_method], temp_coinbase_transfers[cost_method],
+                                      checkpoint_timestamps, checkpoint_f, checkpoint_inputs)
+        analyses.append(iterAnalyzeEth(txns, cost_method, ledgers[cost_method], temp_coinbase_transfers[cost_method]))
+
+    # every analysis is run to its end, past the last state, so transactions without a state (e.g. unmatched
+    #   coinbase transfers) and the checkpoints after them are processed for every method
+    for states in itertools.zip_longest(*analyses):
+        if None in states:
+            raise Exception('Analyses of cost methods {} are out of step'.format(', '.join(cost_methods)))
+        states = dict(zip(cost_methods, states))
+        if len(states) > 1:
+            reportWriter.emit('cost_methods', _comparisonRecord(states))
+        yield states
+
+
+def compareCostMethods(eth_txns_summary, cost_methods):
+    ledgers = {cost_method: Ledger(cost_method) for cost_method in cost_methods}
+    return list(iterCompareCostMethods(eth_txns_summary, ledgers, {cost_method: [] for cost_method in cost_methods}))
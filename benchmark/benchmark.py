@@ -0,0 +1,155 @@
+# Throughput of the transaction pipeline on synthetic wallets, with Etherscan and CoinGecko served locally
+#   python benchmark/benchmark.py [--sizes 1000 10000 100000] [--output results.json]
+#   stages are timed separately, results are written as JSON so they can be compared across commits
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import contextlib
+import json
+import platform
+import subprocess
+import tempfile
+import time
+
+import analyzer
+import etherscanIO
+import ethTransactionsRetriever as ethTxnsRetriever
+import instrumentation
+import priceIO
+import transactionHelper as txnHelper
+from constants import *
+from localApis import LocalCoinGecko, LocalEtherscan
+from syntheticWallets import generateWallets, writeErc1155Spreadsheets
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+# groupByNormalTxns scans every transfer for every normal transaction, larger sizes take too long
+DEFAULT_LEGACY_MAX = 10000
+
+
+def _timeStage(stage_times, stage, func, *args):
+    # Output of the pipeline is not part of its throughput
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        result = func(*args)
+        stage_times[stage] = time.perf_counter() - start
+
+    return result
+
+
+def _gitCommit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _retrieve(wallets, data_path):
+    return {wallet: tuple(list(txns) for txns in ethTxnsRetriever.iterWalletTxns(wallet, data_path, 0,
+                                                                                 LATEST_BLOCK_ETHERSCAN))
+            for wallet in wallets}
+
+
+def _groupByNormalTxns(wallets_txns):
+    txn_groups = []
+    for txns_normal, txns_internal, txns_erc20, txns_erc721, txns_erc1155 in wallets_txns.values():
+        for txn in txns_normal:
+            txn_groups.append(txnHelper.groupByNormalTxns(txn['hash'], txn['timeStamp'], txns_normal, txns_internal,
+                                                          txns_erc20, txns_erc721, txns_erc1155))
+    return txn_groups
+
+
+def _enrichEach(txn_groups):
+    return [txnHelper.enrichTxn(txn_grouped) for txn_grouped in txn_groups]
+
+
+def _resolveContracts(txn_groups, wallets):
+    # Contract lookups go through the Etherscan rate limit, they are resolved before describe is timed
+    addresses = {t['to'].lower() for txn_grouped in txn_groups for t in txn_grouped['txn_normal']
+                 if t['from'].lower() in wallets and t['to']}
+    return [etherscanIO.getContract(address) for address in sorted(addresses)]
+
+
+def runBenchmark(transfer_count, legacy_max=DEFAULT_LEGACY_MAX, seed=0):
+    synthetic_wallets = generateWallets(transfer_count, seed=seed)
+    wallets = synthetic_wallets['wallets']
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        data_path = data_dir + "/"
+        writeErc1155Spreadsheets(synthetic_wallets, data_path)
+
+        # Fresh caches for every size, APIs served locally
+        etherscanIO.initialize('', data_path)
+        etherscanIO.getContract.cache_clear()
+        etherscanIO.getBlockByTimestamp.cache_clear()
+        local_etherscan = etherscanIO.eth = LocalEtherscan(synthetic_wallets)
+        priceIO.token_data_cache.clear()
+        priceIO.initialize(data_path)
+        local_coingecko = priceIO.cg = LocalCoinGecko()
+
+        instrumentation.initialize()
+        stage_times = {}
+        # retrieval is throttled by the Etherscan rate limit, as in a real run
+        wallets_txns = _timeStage(stage_times, 'retrieve', _retrieve, wallets, data_path)
+        if transfer_count <= legacy_max:
+            _timeStage(stage_times, 'group_by_normal_txns', _groupByNormalTxns, wallets_txns)
+        else:
+            stage_times['group_by_normal_txns'] = None
+        txn_groups = _timeStage(stage_times, 'group', lambda: list(txnHelper.iterTxnGroups(wallets_txns)))
+        _timeStage(stage_times, 'enrich_txn', _enrichEach, txn_groups)
+        _timeStage(stage_times, 'enrich_txns', txnHelper.enrichTxns, txn_groups)
+        _timeStage(stage_times, 'resolve_contracts', _resolveContracts, txn_groups, wallets)
+        eth_txns_summary = _timeStage(stage_times, 'describe', txnHelper.describeEthTxns,
+                                      list(synthetic_wallets['coinbase_txns']), txn_groups, wallets)
+        _timeStage(stage_times, 'prefetch_prices', analyzer.prefetchPrices, eth_txns_summary)
+        eth_balances = _timeStage(stage_times, 'analyze', analyzer.analyzeEth, eth_txns_summary, COST_METHOD_HIFO)
+        _timeStage(stage_times, 'compare_cost_methods', analyzer.compareCostMethods, eth_txns_summary,
+                   [COST_METHOD_HIFO, COST_METHOD_FIFO, COST_METHOD_LIFO, COST_METHOD_AVERAGE])
+
+        run_report = instrumentation.report()
+        etherscanIO.contract_db.close()
+        priceIO.price_db.close()
+
+    return {
+        'transfers': synthetic_wallets['transfer_count'],
+        'transaction_groups': len(txn_groups),
+        'descriptions': len(eth_txns_summary),
+        'balances': len(eth_balances),
+        'api_calls': {'etherscan': local_etherscan.calls, 'coingecko': local_coingecko.calls},
+        'rate_limits': run_report['apis'],
+        'caches': run_report['caches'],
+        'stages': stage_times,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the transaction pipeline on synthetic wallets')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='transfers per run')
+    parser.add_argument('--legacy-max', type=int, default=DEFAULT_LEGACY_MAX,
+                        help='largest size groupByNormalTxns is timed for')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='JSON file to write results to, printed if not given')
+    args = parser.parse_args()
+
+    results = {
+        'commit': _gitCommit(),
+        'python': platform.python_version(),
+        'timestamp': int(time.time()),
+        'runs': [],
+    }
+    for transfer_count in args.sizes:
+        print("Benchmark {} transfers".format(transfer_count), file=sys.stderr)
+        results['runs'].append(runBenchmark(transfer_count, args.legacy_max, args.seed))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+import calendar
+import math
+from datetime import *
+
+import syntheticWallets
+from constants import *
+
+ENDPOINT_KEYS = {
+    'get_normal_txs_by_address': 'normal',
+    'get_internal_txs_by_address': 'internal',
+    'get_erc20_token_transfer_events_by_address': 'erc20',
+    'get_erc721_token_transfer_events_by_address': 'erc721',
+}
+
+
+class LocalEtherscan:
+    # Stand-in for etherscanIO.eth, serves synthetic wallets the way Etherscan does:
+    #   ascending block order, at most MAX_RESULTS_ETHERSCAN records, an empty result is an error
+
+    def __init__(self, synthetic_wallets):
+        self.txns = synthetic_wallets['txns']
+        self.calls = 0
+
+    def _getTxns(self, endpoint_key, address, startblock, endblock):
+        self.calls += 1
+        wallet_txns = self.txns.get(address.lower(), {}).get(endpoint_key, [])
+        txns = [t for t in wallet_txns if startblock <= int(t['blockNumber']) <= endblock][:MAX_RESULTS_ETHERSCAN]
+        if not txns:
+            raise AssertionError("[] -- No transactions found")
+
+        return [dict(t) for t in txns]
+
+    def __getattr__(self, func_name):
+        if func_name not in ENDPOINT_KEYS:
+            raise AttributeError(func_name)
+
+        def getTxns(address, startblock, endblock, sort):
+            return self._getTxns(ENDPOINT_KEYS[func_name], address, startblock, endblock)
+
+        return getTxns
+
+    def get_contract_source_code(self, address):
+        self.calls += 1
+        if address.lower() in syntheticWallets.VERIFIED_CONTRACTS:
+            return [{'SourceCode': 'contract Synthetic {}', 'ABI': syntheticWallets.CONTRACT_ABI,
+                     'ContractName': 'Synthetic'}]
+
+        return [{'SourceCode': '', 'ABI': 'Contract source code not verified', 'ContractName': ''}]
+
+    def get_block_number_by_timestamp(self, timestamp, closest):
+        self.calls += 1
+        elapsed = int(timestamp) - syntheticWallets.START_TIMESTAMP
+        block = syntheticWallets.FIRST_BLOCK + elapsed // syntheticWallets.SECONDS_PER_BLOCK
+        if closest == 'after' and elapsed % syntheticWallets.SECONDS_PER_BLOCK:
+            block += 1
+
+        return str(block)
+
+
+def _ethPrice(timestamp):
+    # a smooth made-up price curve, in USD
+    return 2000 + 1500 * math.sin(timestamp / (60 * ONE_DAY))
+
+
+class LocalCoinGecko:
+    # Stand-in for priceIO.cg, prices every 6 hours from 00:00 UTC, ETH by id and ERC-20 tokens by contract
+
+    def __init__(self):
+        self.calls = 0
+
+    def get_coin_market_chart_range_by_id(self, coin_id, vs_currency, from_timestamp, to_timestamp):
+        self.calls += 1
+        first_point = (int(from_timestamp) // (ONE_HOUR * 6) + 1) * ONE_HOUR * 6
+        return {'prices': [[t * 1000, _ethPrice(t)] for t in range(first_point, int(to_timestamp) + 1, ONE_HOUR * 6)]}
+
+    def get_coin_market_chart_range_from_contract_address_by_id(self, platform_id, contract_address, vs_currency,
+                                                                from_timestamp, to_timestamp):
+        # synthetic ERC-20 tokens are stablecoins
+        self.calls += 1
+        first_point = (int(from_timestamp) // (ONE_HOUR * 6) + 1) * ONE_HOUR * 6
+        return {'prices': [[t * 1000, 1.0] for t in range(first_point, int(to_timestamp) + 1, ONE_HOUR * 6)]}
+
+    def get_coin_history_by_id(self, coin_id, date_str):
+        self.calls += 1
+        timestamp = calendar.timegm(datetime.strptime(date_str, "%d-%m-%Y").timetuple())
+        return {'market_data': {'current_price': {'usd': _ethPrice(timestamp)}}}
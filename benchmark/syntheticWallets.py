@@ -0,0 +1,223 @@
+import csv
+import os
+import random
+from datetime import *
+
+START_TIMESTAMP = int(datetime(2021, 1, 1, tzinfo=timezone.utc).timestamp())
+HISTORY_DAYS = 730
+FIRST_BLOCK = 11565019
+SECONDS_PER_BLOCK = 13
+WEI = 10 ** 18
+
+# Contracts of the synthetic chain, verified ones are served with an ABI by the local Etherscan
+MARKETPLACE_CONTRACT = "0x7be8076f4ea4a4ad08075c2508e481d6c946d12b"
+FAILING_CONTRACT = "0x495f947276749ce646f68ac8c248420045cb7b5e"
+ERC721_CONTRACT = "0xbc4ca0eda7647a8ab7c2061c2e118a18a936f13d"
+ERC20_CONTRACT = "0x6b175474e89094c44da98b954eedeac495271d0f"
+ERC1155_CONTRACT = "0x76be3b62873462d2142405439777e971754e8e77"
+VERIFIED_CONTRACTS = (MARKETPLACE_CONTRACT, FAILING_CONTRACT)
+CONTRACT_ABI = '[{"type": "function", "name": "atomicMatch_", "inputs": [{"type": "address[14]"}]}, ' \
+               '{"type": "function", "name": "approve", "inputs": [{"type": "address"}, {"type": "uint256"}]}]'
+
+# Kinds of transactions, by weight, and the number of transfers each of them adds
+TXN_KINDS = {
+    'receive_gift': (10, 1),
+    'gift': (8, 1),
+    'transfer': (6, 2),
+    'failed_txn': (4, 1),
+    'buy_nft_erc721': (12, 2),
+    'buy_nft_erc1155': (6, 2),
+    'buy_erc20': (6, 2),
+    'sell_nft': (10, 2),
+    'receive_erc20': (6, 1),
+    'transfer_nft': (4, 2),
+}
+
+
+def _address(rng):
+    return "0x" + "".join(rng.choice("0123456789abcdef") for _ in range(40))
+
+
+def _hash(rng):
+    return "0x" + "".join(rng.choice("0123456789abcdef") for _ in range(64))
+
+
+def _normalTxn(txn_hash, timestamp, block, addr_from, addr_to, value, rng, is_error='0'):
+    return {
+        'blockNumber': str(block),
+        'timeStamp': str(timestamp),
+        'hash': txn_hash,
+        'from': addr_from,
+        'to': addr_to,
+        'value': str(value),
+        'gas': '250000',
+        'gasPrice': str(rng.randint(20, 150) * 10 ** 9),
+        'gasUsed': str(rng.randint(21000, 200000)),
+        'isError': is_error,
+        'input': '0x' if addr_to not in VERIFIED_CONTRACTS else '0xab834bab' + '0' * 64,
+        'contractAddress': '',
+    }
+
+
+def _internalTxn(txn_hash, timestamp, block, addr_from, addr_to, value):
+    return {
+        'blockNumber': str(block),
+        'timeStamp': str(timestamp),
+        'hash': txn_hash,
+        'from': addr_from,
+        'to': addr_to,
+        'value': str(value),
+        'contractAddress': '',
+        'input': '',
+        'type': 'call',
+        'isError': '0',
+    }
+
+
+def _erc20Txn(txn_hash, timestamp, block, addr_from, addr_to, value):
+    return {
+        'blockNumber': str(block),
+        'timeStamp': str(timestamp),
+        'hash': txn_hash,
+        'from': addr_from,
+        'to': addr_to,
+        'value': str(value),
+        'contractAddress': ERC20_CONTRACT,
+        'tokenName': 'Dai Stablecoin',
+        'tokenSymbol': 'DAI',
+        'tokenDecimal': '18',
+    }
+
+
+def _erc721Txn(txn_hash, timestamp, block, addr_from, addr_to, token_id):
+    return {
+        'blockNumber': str(block),
+        'timeStamp': str(timestamp),
+        'hash': txn_hash,
+        'from': addr_from,
+        'to': addr_to,
+        'contractAddress': ERC721_CONTRACT,
+        'tokenID': str(token_id),
+        'tokenName': 'BoredApeYachtClub',
+        'tokenSymbol': 'BAYC',
+        'tokenDecimal': '0',
+    }
+
+
+def _erc1155Txn(txn_hash, timestamp, addr_from, addr_to, token_id, count):
+    # same fields as fileIO.getErc1155TxnsFromSpreadsheet
+    return {
+        'hash': txn_hash,
+        'timeStamp': str(timestamp),
+        'from': addr_from,
+        'to': addr_to,
+        'contractAddress': ERC1155_CONTRACT,
+        'tokenId': str(token_id),
+        'tokenName': str(count),
+        'tokenSymbol': 'RARI',
+        'note': '',
+    }
+
+
+def generateWallets(transfer_count, wallet_count=2, seed=0):
+    # Wallets with about transfer_count transfers in total, spread over HISTORY_DAYS
+    #   every transaction is of a kind describeEthTxns and analyzeEth handle,
+    #   a Coinbase purchase up front funds everything the wallets spend
+    rng = random.Random(seed)
+    wallets = [_address(rng) for _ in range(wallet_count)]
+    counterparties = [_address(rng) for _ in range(50)]
+    txns = {wallet: {'normal': [], 'internal': [], 'erc20': [], 'erc721': [], 'erc1155': []} for wallet in wallets}
+
+    kinds = list(TXN_KINDS)
+    weights = [TXN_KINDS[kind][0] for kind in kinds]
+    mean_transfers = sum(TXN_KINDS[kind][0] * TXN_KINDS[kind][1] for kind in kinds) / sum(weights)
+    mean_step = HISTORY_DAYS * 86400 / (transfer_count / mean_transfers)
+
+    timestamp = START_TIMESTAMP + 3600
+    token_id = 0
+    eth_spent = 0
+    transfers = 0
+    while transfers < transfer_count:
+        timestamp += max(1, int(rng.expovariate(1 / mean_step)))
+        block = FIRST_BLOCK + (timestamp - START_TIMESTAMP) // SECONDS_PER_BLOCK
+        txn_hash = _hash(rng)
+        wallet = rng.choice(wallets)
+        other_wallet = rng.choice([w for w in wallets if w != wallet] or wallets)
+        counterparty = rng.choice(counterparties)
+        value = rng.randint(1, 50) * WEI // 1000
+        kind = rng.choices(kinds, weights)[0]
+        token_id += 1
+
+        match kind:
+            case 'receive_gift':
+                txns[wallet]['normal'].append(_normalTxn(txn_hash, timestamp, block, counterparty, wallet, value, rng))
+            case 'gift':
+                txns[wallet]['normal'].append(_normalTxn(txn_hash, timestamp, block, wallet, counterparty, value, rng))
+                eth_spent += value
+            case 'transfer':
+                txn = _normalTxn(txn_hash, timestamp, block, wallet, other_wallet, value, rng)
+                txns[wallet]['normal'].append(txn)
+                txns[other_wallet]['normal'].append(dict(txn))
+            case 'failed_txn':
+                txns[wallet]['normal'].append(_normalTxn(txn_hash, timestamp, block, wallet, FAILING_CONTRACT, 0, rng,
+                                                         is_error='1'))
+            case 'buy_nft_erc721':
+                txns[wallet]['normal'].append(_normalTxn(txn_hash, timestamp, block, wallet, MARKETPLACE_CONTRACT,
+                                                         value, rng))
+                txns[wallet]['erc721'].append(_erc721Txn(txn_hash, timestamp, block, counterparty, wallet, token_id))
+                eth_spent += value
+            case 'buy_nft_erc1155':
+                txns[wallet]['normal'].append(_normalTxn(txn_hash, timestamp, block, wallet, MARKETPLACE_CONTRACT,
+                                                         value, rng))
+                txns[wallet]['erc1155'].append(_erc1155Txn(txn_hash, timestamp, counterparty, wallet, token_id,
+                                                           rng.randint(1, 5)))
+                eth_spent += value
+            case 'buy_erc20':
+                txns[wallet]['normal'].append(_normalTxn(txn_hash, timestamp, block, wallet, MARKETPLACE_CONTRACT,
+                                                         value, rng))
+                txns[wallet]['erc20'].append(_erc20Txn(txn_hash, timestamp, block, counterparty, wallet, value * 3000))
+                eth_spent += value
+            case 'sell_nft':
+                txns[wallet]['internal'].append(_internalTxn(txn_hash, timestamp, block, MARKETPLACE_CONTRACT, wallet,
+                                                             value))
+                txns[wallet]['erc721'].append(_erc721Txn(txn_hash, timestamp, block, wallet, counterparty, token_id))
+            case 'receive_erc20':
+                txns[wallet]['erc20'].append(_erc20Txn(txn_hash, timestamp, block, counterparty, wallet, value * 3000))
+            case 'transfer_nft':
+                txn = _erc721Txn(txn_hash, timestamp, block, wallet, other_wallet, token_id)
+                txns[wallet]['erc721'].append(txn)
+                txns[other_wallet]['erc721'].append(dict(txn))
+
+        transfers += TXN_KINDS[kind][1]
+
+    # gas is at most 150 gwei * 200k per transaction
+    eth_needed = eth_spent / WEI + transfers * 0.03 + 1
+    coinbase_txns = [{
+        'Transaction Type': 'Buy',
+        'Asset': 'ETH',
+        # Coinbase exports quantities with a limited number of decimals
+        'Quantity Transacted': '{:.6f}'.format(eth_needed),
+        'Notes': '',
+        'timestamp': START_TIMESTAMP,
+    }]
+
+    return {
+        'wallets': wallets,
+        'txns': txns,
+        'coinbase_txns': coinbase_txns,
+        'transfer_count': transfers,
+    }
+
+
+def writeErc1155Spreadsheets(synthetic_wallets, data_path):
+    # ERC-1155 transfers are read from spreadsheets, see fileIO.getErc1155TxnsFromSpreadsheet
+    path = data_path + "ERC1155/"
+    os.makedirs(path, exist_ok=True)
+    for wallet in synthetic_wallets['wallets']:
+        with open(path + "export-token-1155-{}.csv".format(wallet), "w", newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Txhash', 'UnixTimestamp', 'From', 'To', 'ContractAddress', 'TokenId', 'TokenName',
+                             'TokenSymbol', 'PrivateNote'])
+            for t in synthetic_wallets['txns'][wallet]['erc1155']:
+                writer.writerow([t['hash'], t['timeStamp'], t['from'], t['to'], t['contractAddress'], t['tokenId'],
+                                 t['tokenName'], t['tokenSymbol'], t['note']])
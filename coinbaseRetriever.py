@@ -1,14 +1,40 @@
 import fileIO
+from constants import *
 from datetime import *
 
 
+def _parseTimestamps(timestamps):
+    # UTC timestamps of the reports, e.g. "2021-05-01T12:00:00Z", each distinct value is parsed once
+    #   fromisoformat only takes the 'Z' suffix from Python 3.11, so it is given as an offset,
+    #   timestamps without a time zone are UTC
+    parsed = {}
+    for time_str in set(timestamps):
+        iso_str = time_str.removesuffix(' UTC')
+        if iso_str.endswith('Z'):
+            iso_str = iso_str[:-1] + '+00:00'
+        txn_time = datetime.fromisoformat(iso_str)
+        if txn_time.tzinfo is None:
+            txn_time = txn_time.replace(tzinfo=timezone.utc)
+        parsed[time_str] = int(txn_time.timestamp())
+
+    return [parsed[time_str] for time_str in timestamps]
+
+
 def getCoinbaseTxns(data_path):
+    # Parsed transactions are cached until a report is added, removed or modified
+    cache_f = data_path + COINBASE_CACHE_F
+    stamps = fileIO.getFileStamps(fileIO.getCoinbaseFiles(data_path))
+    txns = fileIO.readParsedCache(cache_f, stamps)
+    if txns is not None:
+        return txns
+
     txns_raw = fileIO.getCoinbaseTxnsFromSpreadsheet(data_path)
 
     # Add UTC timestamp, so it can be comparable with Etherscan transactions later
-    for txn in txns_raw:
-        txn['time'] = datetime.strptime(txn['Timestamp'], '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc)
-        txn['timestamp'] = int(txn['time'].timestamp())
+    timestamps = _parseTimestamps([txn['Timestamp'] for txn in txns_raw])
+    for txn, timestamp in zip(txns_raw, timestamps):
+        txn['timestamp'] = timestamp
         del txn['Timestamp']
 
+    fileIO.cacheParsed(cache_f, stamps, txns_raw)
     return txns_raw
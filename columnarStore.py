@@ -0,0 +1,125 @@
+from constants import WEI_DECIMALS
+import numpy as np
+
+# Transfer types, in the order of columns['kind'] codes
+TRANSFER_KINDS = ('txn_normal', 'txn_internal', 'txn_erc20', 'txn_erc721', 'txn_erc1155')
+KIND_NORMAL, KIND_INTERNAL, KIND_ERC20, KIND_ERC721, KIND_ERC1155 = range(len(TRANSFER_KINDS))
+
+
+def buildTransferColumns(txn_groups):
+    # Flatten transfers of transaction groups into columns, one array per field
+    #   rows are ordered by group, then by transfer type, same as they are listed in the groups,
+    #   so rows of a group and type are a contiguous slice
+    group_col = []
+    kind_col = []
+    hash_col = []
+    timestamp_col = []
+    wallet_col = []
+    contract_col = []
+    from_col = []
+    to_col = []
+    value_raw_col = []
+    decimals_col = []
+    gas_price_col = []
+    gas_used_col = []
+
+    for group_i, txn_grouped in enumerate(txn_groups):
+        wallet = txn_grouped.get('wallet', '')
+        txn_hash = txn_grouped['txn_hash']
+        timestamp = txn_grouped['timeStamp']
+        for kind, group_key in enumerate(TRANSFER_KINDS):
+            for txn in txn_grouped[group_key]:
+                group_col.append(group_i)
+                kind_col.append(kind)
+                hash_col.append(txn_hash)
+                timestamp_col.append(timestamp)
+                wallet_col.append(wallet)
+                contract_col.append(txn.get('contractAddress', ''))
+                from_col.append(txn['from'])
+                to_col.append(txn['to'])
+
+                if kind == KIND_ERC721:
+                    # ERC-721 token is unique
+                    value_raw_col.append('1')
+                    decimals_col.append(0)
+                elif kind == KIND_ERC1155:
+                    # TokenName represents count of 1155 token
+                    value_raw_col.append(txn['tokenName'])
+                    decimals_col.append(0)
+                elif kind == KIND_ERC20:
+                    # tokenDecimal is token precision
+                    value_raw_col.append(txn['value'])
+                    decimals_col.append(int(txn['tokenDecimal'] or WEI_DECIMALS))
+                else:
+                    value_raw_col.append(txn['value'])
+                    decimals_col.append(WEI_DECIMALS)
+
+                gas_price_col.append(txn.get('gasPrice', 0) if kind == KIND_NORMAL else 0)
+                gas_used_col.append(txn.get('gasUsed', 0) if kind == KIND_NORMAL else 0)
+
+    # Amounts are exact integers in base units of their token (wei for ETH), as object columns of Python int,
+    #   since they overflow int64, parsed once per row with int() instead of Decimal
+    #   ERC-1155 counts are parsed at once as a float column, malformed counts raise ValueError as float() does,
+    #   whole counts (all of them in practice) are kept as int
+    #   float columns in whole units are derived from them for aggregates
+    kind = np.array(kind_col, dtype=np.int8)
+    is_count = kind == KIND_ERC1155
+    counts = np.array([v for v, c in zip(value_raw_col, is_count) if c], dtype=np.float64)
+    value_units = np.empty(len(value_raw_col), dtype=object)
+    value_units[~is_count] = [int(v) for v, c in zip(value_raw_col, is_count) if not c]
+    value_units[is_count] = [int(c) if c.is_integer() else c for c in counts.tolist()]
+    gas_wei = np.array([int(p) * int(u) for p, u in zip(gas_price_col, gas_used_col)], dtype=object)
+    decimals = np.array(decimals_col, dtype=np.int64)
+    return {
+        'group': np.array(group_col, dtype=np.int64),
+        'kind': kind,
+        'hash': np.array(hash_col, dtype=object),
+        'timestamp': np.array(timestamp_col, dtype=np.int64),
+        'wallet': np.array(wallet_col, dtype=object),
+        'contract': np.array(contract_col, dtype=object),
+        'from': np.array(from_col, dtype=object),
+        'to': np.array(to_col, dtype=object),
+        'value_units': value_units,
+        'decimals': decimals,
+        'gas_wei': gas_wei,
+        'value': value_units.astype(np.float64) / np.power(10.0, decimals),
+        'gas': gas_wei.astype(np.float64) / np.power(10.0, WEI_DECIMALS),
+    }
+
+
+def filterColumns(columns, mask):
+    return {name: column[mask] for name, column in columns.items()}
+
+
+def filterByTime(columns, start_timestamp, end_timestamp):
+    return filterColumns(columns, (columns['timestamp'] >= start_timestamp) & (columns['timestamp'] <= end_timestamp))
+
+
+def _sumByKey(keys, values):
+    unique_keys, key_index = np.unique(keys, return_inverse=True)
+    sums = np.bincount(key_index, weights=values, minlength=len(unique_keys))
+    return dict(zip(unique_keys.tolist(), sums.tolist()))
+
+
+def gasByMonth(columns, my_wallets):
+    # Gas paid by my wallets, summed by 'YYYY-MM' (UTC)
+    paid = (columns['kind'] == KIND_NORMAL) & np.isin(columns['from'], list(my_wallets))
+    months = columns['timestamp'][paid].astype('datetime64[s]').astype('datetime64[M]').astype(str)
+    return _sumByKey(months, columns['gas'][paid])
+
+
+def addGasByMonth(columns, my_wallets, gas_by_month, start_timestamp=0.0, end_timestamp=float('inf')):
+    # Add gas within the time period to gas_by_month, e.g. for columns of every batch of a stream
+    columns = filterByTime(columns, start_timestamp, end_timestamp)
+    for month, gas_amount in gasByMonth(columns, my_wallets).items():
+        gas_by_month[month] = gas_by_month.get(month, 0.0) + gas_amount
+
+
+def flowsByContract(columns, my_wallets):
+    # Net inflow of tokens to my wallets by contract, outflows are negative
+    my_wallets = list(my_wallets)
+    is_token = columns['kind'] >= KIND_ERC20
+    inflow = np.isin(columns['to'], my_wallets).astype(np.float64)
+    outflow = np.isin(columns['from'], my_wallets).astype(np.float64)
+    net_value = columns['value'] * (inflow - outflow)
+    return _sumByKey(columns['contract'][is_token], net_value[is_token])
@@ -31,20 +31,49 @@ IGNORE_ADDRESS = [x.lower() for x in IGNORE_ADDRESS]
 
 # Cost Method
 COST_METHOD_HIFO = 'HIFO'
+COST_METHOD_FIFO = 'FIFO'
+COST_METHOD_LIFO = 'LIFO'
+COST_METHOD_AVERAGE = 'AVERAGE'
 
+# Coinbase transaction reports may overlap (e.g. yearly exports), a row is identified by these columns
+COINBASE_ROW_KEY = ('Timestamp', 'Transaction Type', 'Asset', 'Quantity Transacted', 'Notes')
 
-# Sorting function
-def SORT_FUNC_BY_PRICE(x):
-    return x['unit_price_usd']
+# Amounts
+WEI_DECIMALS = 18  # ETH amounts are integers in wei
 
+# Assets of the ledger, ERC-20 tokens other than WETH are keyed by their contract address
+ASSET_ETH = 'ETH'
+ASSET_WETH = 'WETH'
+PRICE_PLATFORM = 'ethereum'  # CoinGecko platform of token contract addresses
 
 # For API rate limit
 ONE_MINUTE = 60
 ONE_SECOND = 1
+ONE_HOUR = 3600
+ONE_DAY = 86400
 MAX_CALLS_PER_MINUTE_CG = 25  # API limit is 50 calls/min
 MAX_CALLS_PER_SECOND_CG = 4  # API limit is 8 calls/min
 MAX_CALLS_PER_SECOND_ETHERSCAN = 4  # API limit is 5 calls/sec
+PRICE_RANGE_DAYS = 365  # days of prices filled by a single range request
+MAX_RESULTS_ETHERSCAN = 10000  # API returns at most 10k records per request
+LATEST_BLOCK_ETHERSCAN = 99999999  # end block past the latest one, i.e. up to the latest block
+ENRICH_BATCH_SIZE = 1000  # transaction groups enriched at once while streaming
+DESCRIBE_CHUNK_SIZE = 500  # transaction groups described at once by a worker process
+REPORT_BATCH_SIZE = 1000  # records buffered before they are written out
+PRICE_PREFETCH_WINDOW = 1000  # transactions looked ahead to prefetch their prices while streaming
 
 
 # Files
-TRANSACTION_DATA_CACHE_F = "transaction_datadump.json"
+TRANSACTION_CACHE_DIR = "transaction_cache/"
+TRANSACTION_CACHE_INDEX_F = "index.json"
+SYNC_STATE_F = "sync_state.json"
+CHECKPOINT_F = "checkpoints.json"
+CHECKPOINT_VERSION = 4  # checkpoints of other versions are not read, e.g. version 1 amounts were floats in ETH
+RUN_REPORT_F = "run_report.json"
+REPORT_DIR = "reports/"
+PROFILE_F = "run_profile.prof"
+PRICE_CACHE_F = "price_cache.db"
+CONTRACT_CACHE_F = "contract_cache.db"
+COINBASE_CACHE_F = "coinbase_cache.msgpack"
+ERC1155_CACHE_F = "erc1155_cache.msgpack"
+CONTRACT_CACHE_SIZE = 1024  # contracts kept in memory
@@ -6,16 +6,35 @@ def isContract(contract):
     return len(contract['SourceCode']) > 0
 
 
-def findFunction(contract, txn_input):
-    abi = json.loads(contract['ABI'])
+def buildSelectorIndex(abi_str):
+    # keccak of every function signature is computed once per ABI
+    try:
+        abi = json.loads(abi_str)
+    except ValueError:
+        # ABI of unverified contracts is a message instead
+        return {}
+
+    selectors = {}
     for i in abi:
         if i['type'] != 'function':
             continue
         else:
             func_str = i['name'] + '({})'.format(','.join([x['type'] for x in i['inputs']]))
-            func_hex = web3.Web3.keccak(text=func_str)[:4].hex()
-            if func_hex == txn_input[:10]:
-                return i['name']
+            func_hex = web3.Web3.to_hex(web3.Web3.keccak(text=func_str)[:4])
+            selectors.setdefault(func_hex, i['name'])
+
+    return selectors
+
 
-    return ''
+def getSelectorIndex(contract):
+    # Index is kept alongside the contract
+    if 'Selectors' not in contract:
+        contract['Selectors'] = buildSelectorIndex(contract['ABI'])
+
+    return contract['Selectors']
+
+
+def findFunction(contract, txn_input):
+    # Functions are only resolved from the contract's own ABI, the same transaction is always described the same way
+    return getSelectorIndex(contract).get(txn_input[:10], '')
 
@@ -1,41 +1,173 @@
 import etherscanIO as etherscan
 import fileIO
+from constants import *
+import queue
+import threading
 import csv
 import os
 import json
 
-def getTxns(wallet):
-    # Etherscan API for transactions
-    try:
-        return etherscan.eth.get_normal_txs_by_address(wallet, 0, 99999999, "asc")
-    except:
-        print("Cannot retrieve transasctions for ", wallet)
-        return []
+# Etherscan endpoints synced per wallet, in the order returned by iterWalletTxns
+ENDPOINTS = ('normal', 'internal', 'erc20', 'erc721')
+_END_OF_STREAM = object()
+# (wallet, endpoint) of every block range that failed to be retrieved in this run
+_failed_syncs = set()
 
-def getInternalTxns(wallet):
-    # Etherscan API for transactions
-    try:
-        return etherscan.eth.get_internal_txs_by_address(wallet, 0, 99999999, "asc")
-    except:
-        print("Cannot retrieve internal transactions for ", wallet)
-        return []
 
-def getErc20Txns(wallet):
-    # Etherscan API for transactions
+def _getTxnsFromEtherscan(func_name, wallet, start_block, end_block, txn_type_str):
+    # Etherscan API for transactions, None if they cannot be retrieved
     try:
-        return etherscan.eth.get_erc20_token_transfer_events_by_address(wallet, 0, 99999999, "asc")
+        return etherscan.callApi(func_name, wallet, start_block, end_block, "asc")
+    except AssertionError as e:
+        # Etherscan reports an empty result as an error, e.g. nothing new since the last sync
+        if 'No transactions found' in str(e):
+            return []
+        print("Cannot retrieve {} for ".format(txn_type_str), wallet)
+        return None
     except:
-        print("Cannot retrieve ERC-20 transactions for ", wallet)
-        return []
+        print("Cannot retrieve {} for ".format(txn_type_str), wallet)
+        return None
 
-def getErc721Txns(wallet):
-    # Etherscan API for transactions
-    try:
-        return etherscan.eth.get_erc721_token_transfer_events_by_address(wallet, 0, 99999999, "asc")
-    except:
-        print("Cannot retrieve ERC-721 transactions for ", wallet)
-        return []
+def _iterTxnsFromEtherscan(func_name, wallet, start_block, end_block, txn_type_str):
+    # Walk block-range windows and yield transactions in ascending block order
+    #   a full page means the result is capped, and the last block in it may be cut off,
+    #   so only complete blocks are kept and the next window starts from the last block
+    #   returns whether the whole block range was retrieved
+    while start_block <= end_block:
+        txns = _getTxnsFromEtherscan(func_name, wallet, start_block, end_block, txn_type_str)
+        if txns is None:
+            return False
+        if len(txns) < MAX_RESULTS_ETHERSCAN:
+            yield from txns
+            return True
+
+        last_block = int(txns[-1]['blockNumber'])
+        # a single block holding more than a full page cannot be split any further
+        if last_block == start_block:
+            print("More than {} {} in block {} for ".format(MAX_RESULTS_ETHERSCAN, txn_type_str, last_block), wallet)
+            yield from txns
+            start_block = last_block + 1
+            continue
+
+        for txn in txns:
+            if int(txn['blockNumber']) < last_block:
+                yield txn
+        start_block = last_block
+
+    return True
+
+def iterTxns(wallet, start_block=0, end_block=LATEST_BLOCK_ETHERSCAN):
+    return _iterTxnsFromEtherscan('get_normal_txs_by_address', wallet, start_block, end_block, "transactions")
+
+def iterInternalTxns(wallet, start_block=0, end_block=LATEST_BLOCK_ETHERSCAN):
+    return _iterTxnsFromEtherscan('get_internal_txs_by_address', wallet, start_block, end_block,
+                                  "internal transactions")
+
+def iterErc20Txns(wallet, start_block=0, end_block=LATEST_BLOCK_ETHERSCAN):
+    return _iterTxnsFromEtherscan('get_erc20_token_transfer_events_by_address', wallet, start_block, end_block,
+                                  "ERC-20 transactions")
+
+def iterErc721Txns(wallet, start_block=0, end_block=LATEST_BLOCK_ETHERSCAN):
+    return _iterTxnsFromEtherscan('get_erc721_token_transfer_events_by_address', wallet, start_block, end_block,
+                                  "ERC-721 transactions")
 
 def getErc1155Txns(wallet, data_path):
     # Etherscan API for transactions not yet available, retrieve from spreadsheet
     return fileIO.getErc1155TxnsFromSpreadsheet(wallet, data_path)
+
+def getAllWalletsErc1155Txns(wallets, data_path):
+    # Spreadsheets of all wallets at once, see fileIO.getErc1155TxnsFromSpreadsheets
+    return fileIO.getErc1155TxnsFromSpreadsheets(wallets, data_path)
+
+def _mergeBlockRange(synced_range, start_block, end_block):
+    # Synced blocks of an endpoint are one contiguous range
+    #   a plain block number is the high-water mark of an older sync state, synced from the first block
+    if synced_range is None:
+        return {'first_block': start_block, 'last_block': end_block}
+    if isinstance(synced_range, int):
+        synced_range = {'first_block': 0, 'last_block': synced_range}
+
+    return {'first_block': min(synced_range['first_block'], start_block),
+            'last_block': max(synced_range['last_block'], end_block)}
+
+def _getMissingBlockRanges(synced_range, start_block, end_block):
+    # Block ranges to retrieve, so that the synced range covers start to end block
+    #   ranges are extended to the synced range, so it stays contiguous, in ascending block order
+    if synced_range is None:
+        return [(start_block, end_block)]
+    if isinstance(synced_range, int):
+        synced_range = {'first_block': 0, 'last_block': synced_range}
+
+    block_ranges = []
+    if start_block < synced_range['first_block']:
+        block_ranges.append((start_block, synced_range['first_block'] - 1))
+    if end_block > synced_range['last_block']:
+        block_ranges.append((synced_range['last_block'] + 1, end_block))
+    return block_ranges
+
+def _iterSyncTxns(iter_txns, wallet, wallet_state, endpoint, start_block, end_block):
+    # Stream transactions of the blocks not synced yet for an endpoint of the wallet
+    #   a block range is recorded in the sync state once it is fully retrieved, otherwise the failure is recorded
+    for range_start, range_end in _getMissingBlockRanges(wallet_state.get(endpoint), start_block, end_block):
+        is_complete = yield from iter_txns(wallet, range_start, range_end)
+        if is_complete:
+            wallet_state[endpoint] = _mergeBlockRange(wallet_state.get(endpoint), range_start, range_end)
+        else:
+            _failed_syncs.add((wallet, endpoint))
+
+def hasFailedSyncs():
+    # Whether any block range failed to be retrieved in this run, once every stream is consumed
+    #   transactions of the period are then incomplete, and the analysis state must not be saved as a checkpoint
+    return bool(_failed_syncs)
+
+def _iterInBackground(txns, max_size=MAX_RESULTS_ETHERSCAN):
+    # Retrieve transactions in a background thread, handed over through a bounded queue
+    #   the producer blocks once the queue is full, so retrieval never runs far ahead of the consumer
+    txn_queue = queue.Queue(maxsize=max_size)
+
+    def produce():
+        try:
+            for txn in txns:
+                txn_queue.put(txn)
+            txn_queue.put(_END_OF_STREAM)
+        except Exception as e:
+            txn_queue.put(e)
+
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        txn = txn_queue.get()
+        if txn is _END_OF_STREAM:
+            return
+        if isinstance(txn, Exception):
+            raise txn
+        yield txn
+
+def iterWalletTxns(wallet, data_path, start_block, end_block, sync_state=None,
+                   start_timestamp=0.0, end_timestamp=float('inf'), in_background=False, erc1155_txns=None):
+    # All types of transactions of a wallet within a block range (and its time range):
+    #   normal, internal, ERC-20, ERC-721, ERC-1155
+    #   Etherscan transactions are streamed page by page as they are consumed, in ascending block order
+    #   with a sync state, only blocks not synced yet are retrieved, and the state is updated as they are
+    #   in background, every endpoint is retrieved concurrently, ahead of the consumer by at most a page
+    #   all of them draw from the same Etherscan rate limit, see etherscanIO.callApi
+    wallet_state = sync_state.setdefault(wallet, {}) if sync_state is not None else {}
+    wallet_txns = []
+    for endpoint, iter_txns in zip(ENDPOINTS, (iterTxns, iterInternalTxns, iterErc20Txns, iterErc721Txns)):
+        txns = _iterSyncTxns(iter_txns, wallet, wallet_state, endpoint, start_block, end_block)
+        wallet_txns.append(_iterInBackground(txns) if in_background else txns)
+
+    # spreadsheet is read at once (unless already read with those of other wallets),
+    #   ordered as Etherscan transactions are
+    if erc1155_txns is None:
+        erc1155_txns = getErc1155Txns(wallet, data_path)
+    erc1155_txns = sorted((t for t in erc1155_txns
+                           if start_timestamp <= float(t['timeStamp']) <= end_timestamp),
+                          key=lambda t: int(t['timeStamp']))
+    return (*wallet_txns, erc1155_txns)
+
+def iterAllWalletsTxns(wallets, data_path, start_block, end_block, sync_state=None,
+                       start_timestamp=0.0, end_timestamp=float('inf'), in_background=True):
+    wallets_erc1155_txns = getAllWalletsErc1155Txns(wallets, data_path)
+    return {wallet: iterWalletTxns(wallet, data_path, start_block, end_block, sync_state,
+                                   start_timestamp, end_timestamp, in_background, wallets_erc1155_txns[wallet])
+            for wallet in wallets}
@@ -1,16 +1,104 @@
 from etherscan import Etherscan
 from constants import *
-from ratelimit import limits, sleep_and_retry
+from ratelimit import limits
+import contractHelper
+import instrumentation
+import functools
+import json
+import sqlite3
+import threading
 
+contract_db = None
+_contract_db_lock = threading.Lock()
 
-def initialize(api_key):
+
+def initialize(api_key, data_path=None):
     # initialize API interface
     global eth
     eth = Etherscan(api_key)
 
+    # Persist contracts on disk, verified contract code doesn't change
+    global contract_db
+    if data_path is not None:
+        contract_db = sqlite3.connect(data_path + CONTRACT_CACHE_F, check_same_thread=False)
+        contract_db.execute('CREATE TABLE IF NOT EXISTS contracts (address TEXT PRIMARY KEY, contract TEXT)')
+        contract_db.execute('CREATE TABLE IF NOT EXISTS blocks '
+                            '(timestamp INTEGER, closest TEXT, block INTEGER, PRIMARY KEY (timestamp, closest))')
+
 
 # Conservative rate limit to avoid API errors
-@sleep_and_retry
+#   every Etherscan call goes through here, so concurrent callers share the same budget (thread safe)
+@instrumentation.sleepAndRetry('etherscan')
 @limits(calls=MAX_CALLS_PER_SECOND_ETHERSCAN, period=ONE_SECOND)
+def callApi(func_name, *args):
+    return getattr(eth, func_name)(*args)
+
+
+def _readContractCache(address):
+    # only verified contracts are cached, unverified ones cached by earlier versions are looked up again
+    with _contract_db_lock:
+        row = contract_db.execute('SELECT contract FROM contracts WHERE address = ?', (address,)).fetchone()
+    contract = json.loads(row[0]) if row else None
+    return contract if contract and contract.get('SourceCode') else None
+
+
+def _cacheContract(address, contract):
+    with _contract_db_lock:
+        contract_db.execute('INSERT OR REPLACE INTO contracts VALUES (?, ?)', (address, json.dumps(contract)))
+        contract_db.commit()
+
+
+# Same contracts are looked up repeatedly, keep the most recent ones in memory
+@functools.lru_cache(maxsize=CONTRACT_CACHE_SIZE)
 def getContract(address):
-    return eth.get_contract_source_code(address)[0]
+    address = address.lower()
+    if contract_db is not None:
+        contract = _readContractCache(address)
+        instrumentation.countCache('contracts_disk', hits=int(contract is not None), misses=int(contract is None))
+        if contract is not None:
+            return contract
+
+    # No cache, call API
+    #   addresses that are not (verified) contracts come back with empty source code, they are only kept in memory,
+    #   a contract may be verified later, and an address without code may still have a contract deployed to it
+    contract = callApi('get_contract_source_code', address)[0]
+    # 4-byte selectors are indexed once, and cached with the contract
+    contractHelper.getSelectorIndex(contract)
+    if contract_db is not None and contract.get('SourceCode'):
+        _cacheContract(address, contract)
+
+    return contract
+
+
+def _readBlockCache(timestamp, closest):
+    with _contract_db_lock:
+        row = contract_db.execute('SELECT block FROM blocks WHERE timestamp = ? AND closest = ?',
+                                  (timestamp, closest)).fetchone()
+    return row[0] if row else None
+
+
+def _cacheBlock(timestamp, closest, block):
+    with _contract_db_lock:
+        contract_db.execute('INSERT OR REPLACE INTO blocks VALUES (?, ?, ?)', (timestamp, closest, block))
+        contract_db.commit()
+
+
+@functools.lru_cache(maxsize=None)
+def getBlockByTimestamp(timestamp, closest):
+    # Closest block 'before' or 'after' a UTC timestamp, blocks of the past never change so they are cached on disk
+    timestamp = int(timestamp)
+    if contract_db is not None:
+        block = _readBlockCache(timestamp, closest)
+        instrumentation.countCache('blocks_disk', hits=int(block is not None), misses=int(block is None))
+        if block is not None:
+            return block
+
+    block = int(callApi('get_block_number_by_timestamp', timestamp, closest))
+    if contract_db is not None:
+        _cacheBlock(timestamp, closest, block)
+
+    return block
+
+
+instrumentation.registerCacheInfo('contracts_memory', getContract.cache_info)
+instrumentation.registerCacheInfo('blocks_memory', getBlockByTimestamp.cache_info)
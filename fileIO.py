@@ -1,66 +1,310 @@
+from constants import *
+from datetime import *
+import collections
 import csv
+import hashlib
+import itertools
 import os
 import json
+import heapq
+import mmap
+import msgpack
+import shutil
+
+
+def _parseErc1155Spreadsheet(file_path):
+    with open(file_path, "r", newline='') as f:
+        return [{
+            'hash': t['Txhash'],
+            'timeStamp': t['UnixTimestamp'],
+            'from': t['From'],
+            'to': t['To'],
+            'contractAddress': t['ContractAddress'],
+            'tokenId': t['TokenId'],
+            'tokenName': t['TokenName'],
+            'tokenSymbol': t['TokenSymbol'],
+            'note': t['PrivateNote']
+        } for t in csv.DictReader(f)]
+
+
+def getErc1155TxnsFromSpreadsheets(wallets, data_path):
+    # assumption: a single data file (csv) per wallet, named after it, will be placed under %data_path%/ERC1155
+    #   the directory is indexed once for all wallets, parsed rows are cached per file until the file is modified,
+    #   so only modified files are parsed
+    path = data_path + "ERC1155/"
+    file_names = sorted(file_name for file_name in os.listdir(path) if file_name.endswith(".csv"))
+    wallet_files = {}
+    for wallet in wallets:
+        wallet_files[wallet] = next((file_name for file_name in file_names if wallet.lower() in file_name.lower()),
+                                    None)
+        if wallet_files[wallet] is None:
+            print("Cannot find ERC-1155 data file for ", wallet)
+
+    cache_f = data_path + ERC1155_CACHE_F
+    stamps = getFileStamps([path + file_name for file_name in set(wallet_files.values()) if file_name])
+    txns_by_file = readParsedFilesCache(cache_f, stamps)
+    modified_files = [file_name for file_name in stamps if file_name not in txns_by_file]
+    if modified_files:
+        for file_name in modified_files:
+            txns_by_file[file_name] = _parseErc1155Spreadsheet(path + file_name)
+        cacheParsed(cache_f, stamps, txns_by_file)
+
+    return {wallet: txns_by_file[file_name] if file_name else [] for wallet, file_name in wallet_files.items()}
 
 
 def getErc1155TxnsFromSpreadsheet(wallet, data_path):
-    # assumption: a single data file (csv) will be placed under %data_path%/ERC1155
+    return getErc1155TxnsFromSpreadsheets([wallet], data_path)[wallet]
+
+
+def _iterCoinbaseRows(file_path):
+    # Spreadsheet is downloaded from transaction report, rows follow a preamble and the "Timestamp," header line
+    #   read in a single pass, the header line found is handed to the csv reader along with the rest of the file
+    with open(file_path, "r", newline='') as file:
+        for line in file:
+            if line.startswith("Timestamp,"):
+                yield from csv.DictReader(itertools.chain([line], file))
+                return
+
+
+def getCoinbaseFiles(data_path):
+    # Every data file (csv) placed under %data_path%/Coinbase, e.g. one transaction report per year
+    path = data_path + "Coinbase/"
+    return [path + file_name for file_name in sorted(os.listdir(path)) if file_name.endswith(".csv")]
+
+
+def getErc1155Files(data_path):
+    # Every data file (csv) placed under %data_path%/ERC1155, see getErc1155TxnsFromSpreadsheets
     path = data_path + "ERC1155/"
-    for file in os.listdir(path):
-        if file.endswith(".csv") and wallet.lower() in file.lower():
-            with open(path + file, "r") as f:
-                txns = list(csv.DictReader(f))
-
-            txns_standard = []
-            for t in txns:
-                txns_standard.append({
-                    'hash': t['Txhash'],
-                    'timeStamp': t['UnixTimestamp'],
-                    'from': t['From'],
-                    'to': t['To'],
-                    'contractAddress': t['ContractAddress'],
-                    'tokenId': t['TokenId'],
-                    'tokenName': t['TokenName'],
-                    'tokenSymbol': t['TokenSymbol'],
-                    'note': t['PrivateNote']
-                })
-
-            return txns_standard
-
-    print("Cannot find ERC-1155 data file for ", wallet)
-    return []
+    return [path + file_name for file_name in sorted(os.listdir(path)) if file_name.endswith(".csv")]
+
+
+def getCheckpointInputs(wallets, data_path):
+    # Wallets and a fingerprint of the data files (stamps) analyzed, a checkpoint is only valid for the same inputs
+    #   e.g. a wallet added, or a Coinbase or ERC-1155 report added or modified, needs analysis of the whole history
+    stamps = {'coinbase': getFileStamps(getCoinbaseFiles(data_path)),
+              'erc1155': getFileStamps(getErc1155Files(data_path))}
+    return {
+        'wallets': sorted({wallet.lower() for wallet in wallets}),
+        'files': hashlib.sha256(json.dumps(stamps, sort_keys=True).encode()).hexdigest(),
+    }
 
 
 def getCoinbaseTxnsFromSpreadsheet(data_path):
-    # assumption: a single data file (csv) will be placed under %data_path%/Coinbase,
-    #   Spreadsheet is downloaded from transaction report
-    path = data_path + "Coinbase/"
-    for file_name in os.listdir(path):
-        if file_name.endswith(".csv"):
-            with open(path + file_name, "r") as file:
-                header_line = 0
-                for line in file:
-                    if line.startswith("Timestamp,"):
-                        break
-                    else:
-                        header_line += 1
+    # Rows of all reports, reports may overlap, so a row is kept as many times as the report listing it most often
+    coinbase_files = getCoinbaseFiles(data_path)
+    if not coinbase_files:
+        print("Cannot find any Coinbase data file")
+        return []
+
+    txns = []
+    row_counts = collections.Counter()
+    for file_path in coinbase_files:
+        file_row_counts = collections.Counter()
+        for row in _iterCoinbaseRows(file_path):
+            row_key = tuple(row.get(column) for column in COINBASE_ROW_KEY)
+            file_row_counts[row_key] += 1
+            if file_row_counts[row_key] > row_counts[row_key]:
+                row_counts[row_key] += 1
+                txns.append(row)
+
+    return txns
+
+
+def getFileStamps(file_paths):
+    # Modification time and size of each file, parsed data cached from the files is only valid for the same stamps
+    stamps = {}
+    for file_path in file_paths:
+        stat = os.stat(file_path)
+        stamps[os.path.basename(file_path)] = [stat.st_mtime_ns, stat.st_size]
+
+    return stamps
+
+
+def readParsedCache(cache_f, stamps):
+    # Parsed data of unchanged files, None if any file was added, removed or modified since
+    if not os.path.exists(cache_f):
+        return None
+
+    with open(cache_f, 'rb') as f:
+        cached = msgpack.unpackb(f.read())
+
+    return cached['data'] if cached['stamps'] == stamps else None
+
+
+def readParsedFilesCache(cache_f, stamps):
+    # Parsed data per file, of the files unchanged since cached
+    if not os.path.exists(cache_f):
+        return {}
+
+    with open(cache_f, 'rb') as f:
+        cached = msgpack.unpackb(f.read())
+
+    return {file_name: data for file_name, data in cached['data'].items()
+            if file_name in stamps and cached['stamps'].get(file_name) == stamps[file_name]}
+
+
+def cacheParsed(cache_f, stamps, data):
+    with open(cache_f, 'wb') as f:
+        f.write(msgpack.packb({'stamps': stamps, 'data': data}))
+
+
+def _shardMonth(timestamp):
+    return datetime.utcfromtimestamp(int(timestamp)).strftime("%Y-%m")
+
+
+def getCacheMonths(transaction_data):
+    # Months (UTC) of shards the given transactions belong to
+    return {_shardMonth(t['timeStamp']) for t in transaction_data}
+
+
+def _readCacheIndex(cache_dir):
+    index_f = cache_dir + TRANSACTION_CACHE_INDEX_F
+    if not os.path.exists(index_f):
+        return {}
+
+    with open(index_f) as f:
+        return json.load(f)
+
+
+def cacheTransactions(transaction_data, cache_dir):
+    # Transactions are sharded per wallet and per month (UTC), in msgpack
+    #   given transactions replace the whole content of their shards, other shards are untouched
+    os.makedirs(cache_dir, exist_ok=True)
+    shards = {}
+    for t in transaction_data:
+        shards.setdefault((t.get('wallet') or 'unknown', _shardMonth(t['timeStamp'])), []).append(t)
+
+    # Index of shards with their time range, so reads only load shards within the analysis period
+    cache_index = _readCacheIndex(cache_dir)
+    for (wallet, month), shard_data in shards.items():
+        shard_data.sort(key=lambda t: int(t['timeStamp']))
+        shard_name = "{}_{}.msgpack".format(wallet, month)
+        with open(cache_dir + shard_name, 'wb') as f:
+            f.write(msgpack.packb(shard_data))
+
+        cache_index[shard_name] = {
+            'wallet': wallet,
+            'month': month,
+            'start': int(shard_data[0]['timeStamp']),
+            'end': int(shard_data[-1]['timeStamp']),
+            'count': len(shard_data)
+        }
+
+    with open(cache_dir + TRANSACTION_CACHE_INDEX_F, 'w') as f:
+        json.dump(cache_index, f)
+
+
+def _readShard(shard_f):
+    # Memory-mapped, the file is decoded without being copied to a buffer first
+    with open(shard_f, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return msgpack.unpackb(data)
+
+
+def readTransactionsCache(cache_dir, start_timestamp=0.0, end_timestamp=float('inf'), months=None):
+    # Only shards overlapping the time period (and given months) are loaded
+    transaction_data = []
+    for shard_name, shard in sorted(_readCacheIndex(cache_dir).items(), key=lambda item: item[1]['start']):
+        if shard['end'] < start_timestamp or shard['start'] > end_timestamp:
+            continue
+        if months is not None and shard['month'] not in months:
+            continue
+
+        transaction_data += _readShard(cache_dir + shard_name)
+
+    return transaction_data
+
+
+def _iterShards(cache_dir, shard_names):
+    # One shard in memory at a time, released once its transactions are consumed
+    for shard_name in shard_names:
+        yield from _readShard(cache_dir + shard_name)
+
+
+def iterTransactionsCache(cache_dir, start_timestamp=0.0, end_timestamp=float('inf')):
+    # Stream transactions of the time period in ascending timestamp order
+    #   shards of a wallet are read month after month, and wallets are merged by timestamp
+    shard_names_by_wallet = {}
+    for shard_name, shard in sorted(_readCacheIndex(cache_dir).items(), key=lambda item: item[1]['month']):
+        if shard['end'] < start_timestamp or shard['start'] > end_timestamp:
+            continue
+        shard_names_by_wallet.setdefault(shard['wallet'], []).append(shard_name)
+
+    streams = [_iterShards(cache_dir, shard_names) for shard_names in shard_names_by_wallet.values()]
+    for t in heapq.merge(*streams, key=lambda t: int(t['timeStamp'])):
+        if start_timestamp <= float(t['timeStamp']) <= end_timestamp:
+            yield t
+
+
+def hasTransactionsCache(cache_dir):
+    return os.path.exists(cache_dir + TRANSACTION_CACHE_INDEX_F)
+
+
+def clearTransactionsCache(cache_dir):
+    if os.path.exists(cache_dir):
+        shutil.rmtree(cache_dir)
+
+
+def cacheSyncState(sync_state, sync_state_f):
+    with open(sync_state_f, 'w') as f:
+        json.dump(sync_state, f)
+
+
+def readSyncState(sync_state_f):
+    # No sync state yet, everything will be retrieved
+    if not os.path.exists(sync_state_f):
+        return {}
+
+    with open(sync_state_f) as f:
+        return json.load(f)
+
+
+def _readCheckpoints(checkpoint_f):
+    if not os.path.exists(checkpoint_f):
+        return {}
+
+    with open(checkpoint_f) as f:
+        return json.load(f)
+
+
+def cacheCheckpoint(checkpoint, checkpoint_f):
+    # Checkpoints are kept per cost method, ordered by timestamp, one per timestamp
+    checkpoints = _readCheckpoints(checkpoint_f)
+    cost_method = checkpoint['ledger']['cost_method']
+    method_checkpoints = [c for c in checkpoints.get(cost_method, []) if c['timestamp'] != checkpoint['timestamp']]
+    method_checkpoints.append(checkpoint)
+    method_checkpoints.sort(key=lambda c: c['timestamp'])
+    checkpoints[cost_method] = method_checkpoints
+
+    with open(checkpoint_f, 'w') as f:
+        json.dump(checkpoints, f)
 
-            with open(path + file_name, "r") as file:
-                for i in range(header_line):
-                    next(file)
 
-                return list(csv.DictReader(file))
+def readCheckpoint(checkpoint_f, cost_method, timestamp, inputs=None):
+    # The latest checkpoint at or before the timestamp, None if there is none
+    #   checkpoints of another version or other inputs (see getCheckpointInputs) are ignored,
+    #   analysis then starts over from an earlier one
+    method_checkpoints = [c for c in _readCheckpoints(checkpoint_f).get(cost_method, [])
+                          if c.get('version') == CHECKPOINT_VERSION and c.get('inputs') == inputs
+                          and c['timestamp'] <= timestamp]
+    return method_checkpoints[-1] if method_checkpoints else None
 
-    print("Cannot find any Coinbase data file")
-    return []
 
+def readCommonCheckpoints(checkpoint_f, cost_methods, timestamp, inputs=None):
+    # Checkpoints of every cost method by method, all at the same latest timestamp at or before the timestamp,
+    #   so analyses of the methods open from the same point, None unless every method has one
+    while True:
+        checkpoints = {cost_method: readCheckpoint(checkpoint_f, cost_method, timestamp, inputs)
+                       for cost_method in cost_methods}
+        if None in checkpoints.values():
+            return None
 
-def cacheTransactions(transaction_data, data_cache_f):
-    with open(data_cache_f, 'w') as f:
-        json.dump({'data': transaction_data}, f)
+        timestamps = {checkpoint['timestamp'] for checkpoint in checkpoints.values()}
+        if len(timestamps) == 1:
+            return checkpoints
+        timestamp = min(timestamps)
 
 
-def readTransactionsCache(data_cache_f):
-    with open(data_cache_f) as f:
-        json_data = json.load(f)
-        return json_data['data']
+def clearCheckpoints(checkpoint_f):
+    if os.path.exists(checkpoint_f):
+        os.remove(checkpoint_f)
@@ -0,0 +1,151 @@
+from ratelimit import RateLimitException
+import contextlib
+import cProfile
+import functools
+import json
+import threading
+import time
+
+# Wall time per pipeline stage, calls and rate limit sleeps per external API, hits and misses per cache
+#   stages may nest (e.g. a streaming stage pulling from the previous one), time of a stage excludes
+#   the time of stages nested in it
+_lock = threading.Lock()
+_local = threading.local()
+_start_time = time.perf_counter()
+_stages = {}
+_apis = {}
+_caches = {}
+_cache_info_funcs = {}
+_profile_stage = None
+_profiler = None
+
+
+def initialize(profile_stage=None):
+    # Start over, cProfile is enabled around the given stage only
+    global _start_time, _profile_stage, _profiler
+    with _lock:
+        _start_time = time.perf_counter()
+        _stages.clear()
+        _apis.clear()
+        _caches.clear()
+    _profile_stage = profile_stage or None
+    _profiler = cProfile.Profile() if _profile_stage else None
+
+
+def _stageStack():
+    if not hasattr(_local, 'stage_stack'):
+        _local.stage_stack = []
+    return _local.stage_stack
+
+
+@contextlib.contextmanager
+def stage(name):
+    stage_stack = _stageStack()
+    # [name, start time, time of nested stages]
+    current = [name, time.perf_counter(), 0.0]
+    stage_stack.append(current)
+    is_profiled = name == _profile_stage and _profiler is not None
+    if is_profiled:
+        _profiler.enable()
+    try:
+        yield
+    finally:
+        if is_profiled:
+            _profiler.disable()
+        stage_stack.pop()
+        elapsed = time.perf_counter() - current[1]
+        if stage_stack:
+            stage_stack[-1][2] += elapsed
+
+        with _lock:
+            stage_stats = _stages.setdefault(name, {'seconds': 0.0, 'entries': 0})
+            stage_stats['seconds'] += elapsed - current[2]
+            stage_stats['entries'] += 1
+
+
+def timedIter(name, iterable):
+    # Time spent producing each item of a streaming stage
+    iterator = iter(iterable)
+    while True:
+        with stage(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def _apiStats(api_name):
+    return _apis.setdefault(api_name, {'calls': 0, 'sleeps': 0, 'sleep_seconds': 0.0})
+
+
+def sleepAndRetry(api_name):
+    # Same as ratelimit.sleep_and_retry, with calls and sleeps counted for the API
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            while True:
+                try:
+                    result = func(*args, **kwargs)
+                except RateLimitException as e:
+                    with _lock:
+                        api_stats = _apiStats(api_name)
+                        api_stats['sleeps'] += 1
+                        api_stats['sleep_seconds'] += e.period_remaining
+                    time.sleep(e.period_remaining)
+                    continue
+                except Exception:
+                    with _lock:
+                        _apiStats(api_name)['calls'] += 1
+                    raise
+
+                with _lock:
+                    _apiStats(api_name)['calls'] += 1
+                return result
+
+        return wrapper
+
+    return decorator
+
+
+def countCache(cache_name, hits=0, misses=0):
+    with _lock:
+        cache_stats = _caches.setdefault(cache_name, {'hits': 0, 'misses': 0})
+        cache_stats['hits'] += hits
+        cache_stats['misses'] += misses
+
+
+def registerCacheInfo(cache_name, cache_info_func):
+    # Caches that count for themselves, e.g. functools.lru_cache's cache_info, read when reporting
+    _cache_info_funcs[cache_name] = cache_info_func
+
+
+def report():
+    with _lock:
+        caches = {cache_name: dict(cache_stats) for cache_name, cache_stats in _caches.items()}
+        for cache_name, cache_info_func in _cache_info_funcs.items():
+            cache_info = cache_info_func()
+            caches[cache_name] = {'hits': cache_info.hits, 'misses': cache_info.misses}
+        for cache_stats in caches.values():
+            lookups = cache_stats['hits'] + cache_stats['misses']
+            cache_stats['hit_rate'] = cache_stats['hits'] / lookups if lookups else None
+
+        return {
+            'wall_seconds': time.perf_counter() - _start_time,
+            'stages': {name: dict(stage_stats) for name, stage_stats in _stages.items()},
+            'apis': {api_name: dict(api_stats) for api_name, api_stats in _apis.items()},
+            'caches': caches,
+        }
+
+
+def writeReport(report_f, profile_f=None):
+    run_report = report()
+    if _profiler is not None and profile_f:
+        # binary stats, for pstats or snakeviz
+        _profiler.dump_stats(profile_f)
+        run_report['profile'] = {'stage': _profile_stage, 'stats_file': profile_f}
+
+    with open(report_f, 'w') as f:
+        json.dump(run_report, f, indent=2)
+
+    return run_report
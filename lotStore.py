@@ -0,0 +1,351 @@
+from constants import *
+from nftInventory import NftInventory, loadNftInventory
+import abc
+
+
+class LotStore(abc.ABC):
+    # Open lots of an asset, consumed in the order of a cost method
+    #   lots are kept in a persistent (immutable) structure, so the next lot to consume is always at the head,
+    #   and a snapshot shares structure with the store instead of copying it.
+    #   Balance and USD cost are maintained as lots are added and consumed.
+    #   A lot is a tuple (amount, unit_price_usd, seq), an empty structure is None
+    #   amounts are integers in base units of the asset (wei for ETH), unit prices are USD per whole unit
+
+    cost_method = None
+
+    def __init__(self, decimals=WEI_DECIMALS):
+        self.decimals = decimals
+        self._unit = 10 ** decimals
+        self._lots = None
+        self._seq = 0
+        self.balance = 0
+        self.cost_usd = 0.0
+
+    # Operations on the persistent structure, each returns a new structure and never modifies its input
+    @staticmethod
+    @abc.abstractmethod
+    def _head(lots):
+        pass
+
+    @staticmethod
+    @abc.abstractmethod
+    def _replaceHead(lots, lot):
+        pass
+
+    @staticmethod
+    @abc.abstractmethod
+    def _popHead(lots):
+        pass
+
+    @staticmethod
+    @abc.abstractmethod
+    def _push(lots, lot):
+        pass
+
+    @staticmethod
+    @abc.abstractmethod
+    def _iterLots(lots):
+        # every lot, in order of consumption
+        pass
+
+    def add(self, amount, unit_price_usd):
+        self._lots = self._push(self._lots, (amount, unit_price_usd, self._seq))
+        self._seq += 1
+        self.balance += amount
+        self.cost_usd += amount * unit_price_usd / self._unit
+
+    def consume(self, amount):
+        # Reduce amount from lots in order, until all of it is accounted and deducted
+        cost_reduced = []
+        lots = self._lots
+        remaining = amount
+        while remaining > 0 and lots is not None:
+            lot_amount, unit_price_usd, seq = self._head(lots)
+
+            # current lot enough to account for amount
+            if remaining < lot_amount:
+                cost_reduced.append({'amount': remaining, 'unit_price_usd': unit_price_usd})
+                lots = self._replaceHead(lots, (lot_amount - remaining, unit_price_usd, seq))
+                remaining = 0
+
+            # current lot fully exhausted by remaining amount
+            else:
+                cost_reduced.append({'amount': lot_amount, 'unit_price_usd': unit_price_usd})
+                lots = self._popHead(lots)
+                remaining -= lot_amount
+
+        # All lots exhausted, but still remaining amount
+        if remaining != 0:
+            raise Exception('Not enough ETH to spend')
+
+        self._lots = lots
+        self.balance -= amount
+        self.cost_usd -= sum([c['amount'] * c['unit_price_usd'] for c in cost_reduced]) / self._unit
+        # no rounding residue once every lot is gone
+        if lots is None:
+            self.cost_usd = 0.0
+
+        return cost_reduced
+
+    def increaseCost(self, cost):
+        # Added USD cost is carried by the next lot to consume
+        if self._lots is None:
+            raise Exception('No ETH left to carry cost')
+
+        lot_amount, unit_price_usd, seq = self._head(self._lots)
+        self._lots = self._replaceHead(self._lots, (lot_amount, unit_price_usd + cost * self._unit / lot_amount, seq))
+        self.cost_usd += cost
+
+    def snapshot(self):
+        return LotSnapshot(self, self._lots)
+
+    def dump(self):
+        # Plain data of the store, to be restored by loadLotStore
+        return {
+            'cost_method': self.cost_method,
+            'decimals': self.decimals,
+            'lots': [list(lot) for lot in self._iterLots(self._lots)],
+            'seq': self._seq,
+            'balance': self.balance,
+            'cost_usd': self.cost_usd,
+        }
+
+    def toList(self):
+        return self.snapshot().toList()
+
+
+class LotSnapshot:
+    # Immutable view of a lot store at one point in time, O(1) to take
+
+    __slots__ = ('_iter_lots', '_lots', 'balance', 'cost_usd')
+
+    def __init__(self, lot_store, lots):
+        self._iter_lots = lot_store._iterLots
+        self._lots = lots
+        self.balance = lot_store.balance
+        self.cost_usd = lot_store.cost_usd
+
+    def toList(self):
+        return [{'amount': amount, 'unit_price_usd': unit_price_usd}
+                for amount, unit_price_usd, _ in self._iter_lots(self._lots)]
+
+
+def _hifoBefore(lot_a, lot_b):
+    # higher unit price first, ties broken by order of acquisition
+    return lot_a[1] > lot_b[1] or (lot_a[1] == lot_b[1] and lot_a[2] < lot_b[2])
+
+
+def _hifoMerge(heap_a, heap_b):
+    # Merge two leftist heaps, only nodes along the right spines are rebuilt, O(log n)
+    if heap_a is None:
+        return heap_b
+    if heap_b is None:
+        return heap_a
+    if _hifoBefore(heap_b[1], heap_a[1]):
+        heap_a, heap_b = heap_b, heap_a
+
+    _, lot, left, right = heap_a
+    merged = _hifoMerge(right, heap_b)
+    if left is None or left[0] < merged[0]:
+        left, merged = merged, left
+
+    return (merged[0] + 1 if merged else 1), lot, left, merged
+
+
+class HifoLotStore(LotStore):
+    # Persistent leftist max-heap by unit price, nodes are (rank, lot, left, right)
+
+    cost_method = COST_METHOD_HIFO
+
+    @staticmethod
+    def _head(lots):
+        return lots[1]
+
+    @staticmethod
+    def _replaceHead(lots, lot):
+        # price of the head only ever increases, so it stays at the top of the heap
+        return lots[0], lot, lots[2], lots[3]
+
+    @staticmethod
+    def _popHead(lots):
+        return _hifoMerge(lots[2], lots[3])
+
+    @staticmethod
+    def _push(lots, lot):
+        return _hifoMerge(lots, (1, lot, None, None))
+
+    @staticmethod
+    def _iterLots(lots):
+        while lots is not None:
+            yield lots[1]
+            lots = _hifoMerge(lots[2], lots[3])
+
+
+def _consList(items):
+    lots = None
+    for item in items:
+        lots = (item, lots)
+    return lots
+
+
+def _iterConsList(lots):
+    while lots is not None:
+        yield lots[0]
+        lots = lots[1]
+
+
+class FifoLotStore(LotStore):
+    # Persistent queue (front, back) of cons lists, oldest lot first
+    #   back is reversed into front only when front runs out
+
+    cost_method = COST_METHOD_FIFO
+
+    @staticmethod
+    def _head(lots):
+        return lots[0][0]
+
+    @staticmethod
+    def _replaceHead(lots, lot):
+        return (lot, lots[0][1]), lots[1]
+
+    @staticmethod
+    def _popHead(lots):
+        front, back = lots[0][1], lots[1]
+        if front is None:
+            if back is None:
+                return None
+            front, back = _consList(_iterConsList(back)), None
+
+        return front, back
+
+    @staticmethod
+    def _push(lots, lot):
+        if lots is None:
+            return (lot, None), None
+
+        return lots[0], (lot, lots[1])
+
+    @staticmethod
+    def _iterLots(lots):
+        if lots is None:
+            return
+        yield from _iterConsList(lots[0])
+        yield from reversed(list(_iterConsList(lots[1])))
+
+
+class LifoLotStore(LotStore):
+    # Persistent stack as a cons list, newest lot first
+
+    cost_method = COST_METHOD_LIFO
+
+    @staticmethod
+    def _head(lots):
+        return lots[0]
+
+    @staticmethod
+    def _replaceHead(lots, lot):
+        return lot, lots[1]
+
+    @staticmethod
+    def _popHead(lots):
+        return lots[1]
+
+    @staticmethod
+    def _push(lots, lot):
+        return lot, lots
+
+    @staticmethod
+    def _iterLots(lots):
+        return _iterConsList(lots)
+
+
+class AverageCostLotStore(LotStore):
+    # All lots pooled into one, at the average unit price
+
+    cost_method = COST_METHOD_AVERAGE
+
+    @staticmethod
+    def _head(lots):
+        return lots
+
+    @staticmethod
+    def _replaceHead(lots, lot):
+        return lot
+
+    @staticmethod
+    def _popHead(lots):
+        return None
+
+    @staticmethod
+    def _push(lots, lot):
+        if lots is None:
+            return lot
+
+        amount = lots[0] + lot[0]
+        return amount, (lots[0] * lots[1] + lot[0] * lot[1]) / amount, lots[2]
+
+    @staticmethod
+    def _iterLots(lots):
+        return iter([lots] if lots is not None else [])
+
+
+LOT_STORES = {
+    COST_METHOD_HIFO: HifoLotStore,
+    COST_METHOD_FIFO: FifoLotStore,
+    COST_METHOD_LIFO: LifoLotStore,
+    COST_METHOD_AVERAGE: AverageCostLotStore,
+}
+
+
+def createLotStore(cost_method, decimals=WEI_DECIMALS):
+    if cost_method not in LOT_STORES:
+        raise Exception('Unknown cost method {}'.format(cost_method))
+
+    return LOT_STORES[cost_method](decimals)
+
+
+def loadLotStore(data):
+    # Lots are pushed back in order of acquisition, which rebuilds the same order of consumption for every method
+    lot_store = createLotStore(data['cost_method'], data['decimals'])
+    for amount, unit_price_usd, seq in sorted(data['lots'], key=lambda lot: lot[2]):
+        lot_store._lots = lot_store._push(lot_store._lots, (amount, unit_price_usd, seq))
+    lot_store._seq = data['seq']
+    lot_store.balance = data['balance']
+    lot_store.cost_usd = data['cost_usd']
+
+    return lot_store
+
+
+class Ledger:
+    # Lot stores of every asset held: ETH, WETH and ERC-20 tokens by contract address, and the NFTs held
+    #   all assets are kept up to date in a single pass over the timeline,
+    #   the lot store of an asset is created the first time the asset is seen
+
+    def __init__(self, cost_method=COST_METHOD_HIFO):
+        self.cost_method = cost_method
+        self.lot_stores = {}
+        self.lotStore(ASSET_ETH)
+        self.nfts = NftInventory()
+
+    def lotStore(self, asset, decimals=WEI_DECIMALS):
+        lot_store = self.lot_stores.get(asset)
+        if lot_store is None:
+            lot_store = self.lot_stores[asset] = createLotStore(self.cost_method, decimals)
+
+        return lot_store
+
+    def dump(self):
+        return {
+            'cost_method': self.cost_method,
+            'lot_stores': {asset: lot_store.dump() for asset, lot_store in self.lot_stores.items()},
+            'nfts': self.nfts.dump(),
+        }
+
+
+def loadLedger(data):
+    ledger = Ledger(data['cost_method'])
+    for asset, lot_store_data in data['lot_stores'].items():
+        ledger.lot_stores[asset] = loadLotStore(lot_store_data)
+    ledger.nfts = loadNftInventory(data['nfts'])
+
+    return ledger
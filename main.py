@@ -4,6 +4,10 @@ import coinbaseRetriever
 import fileIO
 import transactionHelper as txnHelper
 import analyzer
+import columnarStore
+import priceIO
+import instrumentation
+import reportWriter
 from constants import *
 import json
 import os
@@ -16,8 +20,17 @@ with open(os.path.curdir + "/config/config.json") as json_data_file:
     config = json.load(json_data_file)
 
 data_path = os.path.curdir + config['dataFilePath']
-data_cache_f = data_path + TRANSACTION_DATA_CACHE_F
-etherscanIO.initialize(config['etherscanApiKey'])
+cache_dir = data_path + TRANSACTION_CACHE_DIR
+sync_state_f = data_path + SYNC_STATE_F
+checkpoint_f = data_path + CHECKPOINT_F
+# Several cost methods are analyzed side by side in a single pass, balances of the first one are kept
+cost_methods = config.get('costMethods', [COST_METHOD_HIFO])
+# Stage timers, API calls and cache hit rates are reported at the end of the run, optionally with cProfile of a stage
+instrumentation.initialize(profile_stage=config.get('profileStage'))
+# Descriptions, balances and tax events are written as report files, and only shown on console at a higher level
+reportWriter.initialize(data_path + REPORT_DIR, config.get('reportFormat', 'jsonl'), config.get('outputLevel', 'quiet'))
+etherscanIO.initialize(config['etherscanApiKey'], data_path)
+priceIO.initialize(data_path)
 
 my_wallets = [x.lower() for x in config['ethWallets']]
 
@@ -35,67 +48,114 @@ print("\nTime period for analysis {} to {}".format(start_date, end_date))
 # Retrieve transaction data
 ## Coinbase transactions
 print("Processing Coinbase transactions")
-coinbase_txns = coinbaseRetriever.getCoinbaseTxns(data_path)
+with instrumentation.stage('coinbase'):
+    coinbase_txns = coinbaseRetriever.getCoinbaseTxns(data_path)
 
 ## Etherscan transactions
-# optimize speed by checking data cache
-if config['forceNewData'] or not os.path.exists(data_path + TRANSACTION_DATA_CACHE_F):
-    txn_groups = []
-    for wallet_addr in my_wallets:
-        print("Processing Etherscan transactions for wallet ", wallet_addr)
-
-        # Retrieve each type of transactions
-        txns_normal = ethTxnsRetriever.getTxns(wallet_addr)
-        txns_internal = ethTxnsRetriever.getInternalTxns(wallet_addr)
-        txns_erc20 = ethTxnsRetriever.getErc20Txns(wallet_addr)
-        txns_erc721 = ethTxnsRetriever.getErc721Txns(wallet_addr)
-        txns_erc1155 = ethTxnsRetriever.getErc1155Txns(wallet_addr, data_path)
-
-        txns_all = txns_normal + txns_internal + txns_erc20 + txns_erc721 + txns_erc1155
-
-        txn_count = 0
-        # Group everything around normal transactions
-        for txn in txns_all:
-            result = any(item['txn_hash'] == txn['hash'] for item in txn_groups)
-            if result:
-                continue
-
-            # UTC timestamp
-            time_stamp = float(txn['timeStamp'])
-            date = datetime.utcfromtimestamp(time_stamp)
-            if time_stamp < start_timestamp or time_stamp > end_timestamp:
-                continue
-
-            # Join transactions into groups around the same transaction hash
-            txn_grouped = txnHelper.groupByNormalTxns(txn['hash'], txn['timeStamp'],
-                                                      txns_normal, txns_internal,
-                                                      txns_erc20, txns_erc721, txns_erc1155)
-
-            # Extract and enrich transaction group with key information, e.g. gas, ETH amounts, tokens
-            txn_grouped_enriched = txnHelper.enrichTxn(txn_grouped)
-
-            txn_groups.append(txn_grouped_enriched)
-            txn_count += 1
-
-        print(str(txn_count), " transactions processed")
-
-    # cache new data to file
-    fileIO.cacheTransactions(txn_groups, data_cache_f)
-
-# read from data dump instead
+# optimize speed by syncing incrementally on top of the data cache
+if config['forceNewData'] or not fileIO.hasTransactionsCache(cache_dir):
+    fileIO.clearTransactionsCache(cache_dir)
+    fileIO.clearCheckpoints(checkpoint_f)
+    sync_state = {}
 else:
-    txn_groups = fileIO.readTransactionsCache(data_cache_f)
+    sync_state = fileIO.readSyncState(sync_state_f)
+
+# Opening balance comes from the latest checkpoint before the analysis period, common to every cost method,
+#   only transactions after it are needed, without a checkpoint the whole history is
+#   checkpoints of other wallets or data files are ignored
+checkpoint_inputs = fileIO.getCheckpointInputs(my_wallets, data_path)
+checkpoints = fileIO.readCommonCheckpoints(checkpoint_f, cost_methods, start_timestamp, checkpoint_inputs) or {}
+if checkpoints:
+    checkpoint_timestamp = checkpoints[cost_methods[0]]['timestamp']
+    opening_timestamp = checkpoint_timestamp + ONE_SECOND
+    print("Opening balance from checkpoint at {}".format(datetime.utcfromtimestamp(checkpoint_timestamp)))
+else:
+    opening_timestamp = 0.0
+
+# Time period is converted to a block range for Etherscan, blocks by timestamp are cached
+#   if it cannot be, every block up to the latest is retrieved, transactions are read from cache by time anyway,
+#   the sync state is left as is, the range retrieved doesn't end at a known block
+txns_sync_state = sync_state
+with instrumentation.stage('blocks'):
+    try:
+        start_block = etherscanIO.getBlockByTimestamp(opening_timestamp, 'after') if opening_timestamp else 0
+        end_block = etherscanIO.getBlockByTimestamp(end_timestamp, 'before')
+    except Exception as e:
+        print("Cannot convert time period to blocks, retrieving all blocks: {}".format(e))
+        start_block, end_block = 0, LATEST_BLOCK_ETHERSCAN
+        txns_sync_state = None
+
+# Stream each type of transactions of blocks not synced yet, all wallets concurrently unless disabled
+#   transactions flow through grouping into the cache, in timestamp order, a month at a time
+print("Processing Etherscan transactions for {} wallets".format(len(my_wallets)))
+wallets_txns = ethTxnsRetriever.iterAllWalletsTxns(my_wallets, data_path, start_block, end_block, txns_sync_state,
+                                                   opening_timestamp, end_timestamp,
+                                                   in_background=config.get('concurrentFetch', True))
+wallets_txns = {wallet_addr: tuple(instrumentation.timedIter('retrieve', txns) for txns in wallet_txns)
+                for wallet_addr, wallet_txns in wallets_txns.items()}
+new_txn_groups = instrumentation.timedIter('group', txnHelper.iterTxnGroups(wallets_txns))
+with instrumentation.stage('cache'):
+    txn_count = txnHelper.syncTxnGroupsToCache(new_txn_groups, cache_dir)
+print(str(txn_count), " new transactions processed")
+fileIO.cacheSyncState(sync_state, sync_state_f)
+# Checkpoints are only saved when the period is fully synced, a later run would not analyze the blocks missing now
+is_synced = not ethTxnsRetriever.hasFailedSyncs()
+if not is_synced:
+    print("Some Etherscan transactions could not be retrieved, no checkpoint is saved in this run")
 
 # Create analytics
 try:
-    # Normalize coinbase and etherscan transactions
-    print("Summarize ETH transactions")
-    eth_txns_summary = txnHelper.describeEthTxns(coinbase_txns, txn_groups, my_wallets)
+    # Stream transactions from the opening balance to the end of analysis period from cache,
+    #   through description and analysis
+    #   each stage pulls from the previous one, so only a bounded window of transactions is held at any time
+    #   aggregates of the analysis period run over columns of each batch of transfers
+    gas_by_month = {}
+    txn_groups = instrumentation.timedIter('read_cache',
+                                           fileIO.iterTransactionsCache(cache_dir, opening_timestamp, end_timestamp))
+    txn_groups = instrumentation.timedIter('enrich', txnHelper.iterEnrichTxns(
+        txn_groups, on_columns=lambda columns: columnarStore.addGasByMonth(columns, my_wallets, gas_by_month,
+                                                                           start_timestamp, end_timestamp)))
 
-    # Create analytic and timeline around ETH transactions
-    print("Analyze ETH")
-    eth_balances = analyzer.analyzeEth(eth_txns_summary, cost_method=COST_METHOD_HIFO)
+    # Normalize coinbase and etherscan transactions
+    print("Summarize and analyze ETH transactions")
+    coinbase_txns = sorted((t for t in coinbase_txns if opening_timestamp <= t['timestamp'] <= end_timestamp),
+                           key=lambda x: x['timestamp'])
+    eth_txns_summary = txnHelper.iterDescribeEthTxns(coinbase_txns, txn_groups, my_wallets,
+                                                     parallel=config.get('parallelDescribe', False))
+    eth_txns_summary = instrumentation.timedIter('describe', eth_txns_summary)
+
+    # Resolve prices a window ahead of analysis, separately from the computation
+    eth_txns_summary = instrumentation.timedIter('prefetch_prices', analyzer.iterPrefetchPrices(eth_txns_summary))
+
+    # Create analytic and timeline around ETH transactions, balances are kept for the analysis period
+    #   the analysis state (ledger with NFT inventory) is saved at every year end, a later run opens from the
+    #   latest year end before its analysis period instead of the whole history
+    #   every cost method has its own ledger, fed by the same described and priced transactions
+    ledgers, temp_coinbase_transfers = {}, {}
+    for cost_method in cost_methods:
+        ledgers[cost_method], temp_coinbase_transfers[cost_method] = analyzer.openCheckpoint(
+            checkpoints.get(cost_method), cost_method)
+    eth_states = analyzer.iterCompareCostMethods(eth_txns_summary, ledgers, temp_coinbase_transfers,
+                                                 analyzer.yearEndTimestamps(opening_timestamp, end_timestamp),
+                                                 checkpoint_f if is_synced else None, checkpoint_inputs)
+    eth_balances = [states[cost_methods[0]] for states in instrumentation.timedIter('analyze', eth_states)
+                    if states[cost_methods[0]]['timestamp'] >= start_timestamp]
+
+    # Closing balance is the opening balance of a later analysis period
+    if is_synced:
+        for cost_method, ledger in ledgers.items():
+            fileIO.cacheCheckpoint(analyzer.createCheckpoint(int(end_timestamp), ledger,
+                                                             temp_coinbase_transfers[cost_method],
+                                                             checkpoint_inputs), checkpoint_f)
+
+    for month, gas_amount in sorted(gas_by_month.items()):
+        print("Gas spent in {}: {:.5f}E".format(month, gas_amount))
 except Exception as e:
     print("Caught an exception {}".format(e.__traceback__))
+finally:
+    reportWriter.close()
+
+instrumentation.writeReport(data_path + RUN_REPORT_F, data_path + PROFILE_F)
+print("Run report written to {}".format(data_path + RUN_REPORT_F))
 
 print("Transaction count")
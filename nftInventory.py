@@ -0,0 +1,66 @@
+class NftInventory:
+    # NFTs held, by (contract, token id), each with its quantity (always 1 for ERC-721) and USD cost basis
+    #   cost is allocated to NFTs as they are acquired, and looked up in O(1) as they are sold, burned or given away
+    #   totals are maintained as NFTs are added and removed, so a balance state doesn't scan the inventory
+
+    def __init__(self):
+        self._holdings = {}
+        self.quantity = 0
+        self.cost_usd = 0.0
+
+    def add(self, contract, token_id, quantity, cost_usd):
+        holding = self._holdings.setdefault((contract, token_id), [0, 0.0])
+        holding[0] += quantity
+        holding[1] += cost_usd
+        self.quantity += quantity
+        self.cost_usd += cost_usd
+
+    def remove(self, contract, token_id, quantity):
+        # Cost basis of the quantity removed, a share of the cost of the holding
+        #   NFTs not held (e.g. acquired before any tracked transaction) are removed at no cost
+        holding = self._holdings.get((contract, token_id))
+        if holding is None:
+            return 0.0
+
+        quantity = min(quantity, holding[0])
+        cost_usd = holding[1] * quantity / holding[0]
+        if quantity == holding[0]:
+            del self._holdings[(contract, token_id)]
+        else:
+            holding[0] -= quantity
+            holding[1] -= cost_usd
+        self.quantity -= quantity
+        self.cost_usd -= cost_usd
+
+        return cost_usd
+
+    def holds(self, contract, token_id):
+        return (contract, token_id) in self._holdings
+
+    def increaseCost(self, contract, token_id, cost_usd):
+        # Added USD cost is carried by the holding, e.g. gas of moving it between wallets
+        self._holdings[(contract, token_id)][1] += cost_usd
+        self.cost_usd += cost_usd
+
+    def addAll(self, nfts, cost_usd):
+        # Cost of acquiring several NFTs at once is allocated evenly over the quantity acquired
+        quantity = sum(nft['quantity'] for nft in nfts)
+        for nft in nfts:
+            self.add(nft['contract'], nft['id'], nft['quantity'], cost_usd * nft['quantity'] / quantity)
+
+    def toList(self):
+        return [{'contract': contract, 'id': token_id, 'quantity': quantity, 'cost_usd': cost_usd}
+                for (contract, token_id), (quantity, cost_usd) in self._holdings.items()]
+
+    def dump(self):
+        # Plain data of the inventory, to be restored by loadNftInventory
+        return [[contract, token_id, quantity, cost_usd]
+                for (contract, token_id), (quantity, cost_usd) in self._holdings.items()]
+
+
+def loadNftInventory(data):
+    nft_inventory = NftInventory()
+    for contract, token_id, quantity, cost_usd in data:
+        nft_inventory.add(contract, token_id, quantity, cost_usd)
+
+    return nft_inventory
@@ -1,14 +1,39 @@
 from constants import *
 from pycoingecko import CoinGeckoAPI
 from datetime import *
-from ratelimit import limits, sleep_and_retry
+from ratelimit import limits
+import calendar
+import instrumentation
+import sqlite3
 
 cg = CoinGeckoAPI()
 token_data_cache = {}
+price_db = None
+
+
+def initialize(data_path):
+    # Persist prices on disk, so they are requested only once across runs
+    global price_db
+    price_db = sqlite3.connect(data_path + PRICE_CACHE_F)
+    price_db.execute('CREATE TABLE IF NOT EXISTS prices ('
+                     'token TEXT, quote TEXT, day TEXT, price REAL, PRIMARY KEY (token, quote, day))')
+
+    # Load persisted prices to memory, lookups never go to disk
+    for from_token, to, date_str, price in price_db.execute('SELECT token, quote, day, price FROM prices'):
+        token_data_cache.setdefault(from_token, {}).setdefault(to, {})[date_str] = price
+
+
+def _cachePrices(from_token, to, prices):
+    token_data_cache.setdefault(from_token, {}).setdefault(to, {}).update(prices)
+
+    if price_db is not None:
+        price_db.executemany('INSERT OR REPLACE INTO prices VALUES (?, ?, ?, ?)',
+                             [(from_token, to, date_str, price) for date_str, price in prices.items()])
+        price_db.commit()
 
 
 # Conservative rate limit to avoid API errors
-@sleep_and_retry
+@instrumentation.sleepAndRetry('coingecko')
 @limits(calls=MAX_CALLS_PER_MINUTE_CG, period=ONE_MINUTE)
 @limits(calls=MAX_CALLS_PER_SECOND_CG, period=ONE_SECOND)
 def _getCoinHistoryByIdCoinGecko(from_token, date_str):
@@ -16,6 +41,80 @@ def _getCoinHistoryByIdCoinGecko(from_token, date_str):
     return cg.get_coin_history_by_id(from_token.lower(), date_str)
 
 
+@instrumentation.sleepAndRetry('coingecko')
+@limits(calls=MAX_CALLS_PER_MINUTE_CG, period=ONE_MINUTE)
+@limits(calls=MAX_CALLS_PER_SECOND_CG, period=ONE_SECOND)
+def _getCoinMarketChartRangeByIdCoinGecko(from_token, to, from_timestamp, to_timestamp):
+    global cg
+    return cg.get_coin_market_chart_range_by_id(from_token.lower(), to, from_timestamp, to_timestamp)
+
+
+@instrumentation.sleepAndRetry('coingecko')
+@limits(calls=MAX_CALLS_PER_MINUTE_CG, period=ONE_MINUTE)
+@limits(calls=MAX_CALLS_PER_SECOND_CG, period=ONE_SECOND)
+def _getContractMarketChartRangeCoinGecko(contract, to, from_timestamp, to_timestamp):
+    global cg
+    try:
+        return cg.get_coin_market_chart_range_from_contract_address_by_id(PRICE_PLATFORM, contract, to,
+                                                                          from_timestamp, to_timestamp)
+    except ValueError as e:
+        # token not listed, e.g. spam airdrops, it has no price
+        if 'not found' in str(e):
+            return {'prices': []}
+        raise
+
+
+def _isContract(token):
+    # ERC-20 tokens are priced by their contract address, other tokens by CoinGecko id
+    return token.startswith('0x')
+
+
+def _getDayPrice(from_token, to, date_str):
+    # Price of a single day, for days not covered by range data, None if there is no price
+    if _isContract(from_token):
+        # no daily history by contract address, the day is left without price
+        return None
+
+    price_data = _getCoinHistoryByIdCoinGecko(from_token, date_str)
+    return price_data['market_data']['current_price'][to]
+
+
+def _cacheDayPrice(from_token, to, date_str, price):
+    # A day without price is valued at 0 for the rest of the run only, it is not persisted,
+    #   so it is requested again by a later run, once the price may be available
+    if price is None:
+        token_data_cache.setdefault(from_token, {}).setdefault(to, {})[date_str] = 0.0
+        return 0.0
+
+    _cachePrices(from_token, to, {date_str: price})
+    return price
+
+
+def _toDateStr(date_obj):
+    return "%02d-%02d-%4d" % (date_obj.day, date_obj.month, date_obj.year)
+
+
+def _fillTokenHistData(from_token, to, first_date, last_date):
+    # One range request covers many days, instead of one request per day
+    #   history prices are taken at 00:00 UTC, so only the first data point within the first hour of a day is kept
+    from_timestamp = calendar.timegm(first_date.timetuple()) - ONE_HOUR
+    to_timestamp = min(calendar.timegm(last_date.timetuple()) + ONE_HOUR, int(datetime.now().timestamp()))
+    if _isContract(from_token):
+        price_data = _getContractMarketChartRangeCoinGecko(from_token, to, from_timestamp, to_timestamp)
+    else:
+        price_data = _getCoinMarketChartRangeByIdCoinGecko(from_token, to, from_timestamp, to_timestamp)
+
+    prices = {}
+    for timestamp_ms, price in price_data['prices']:
+        timestamp = timestamp_ms // 1000
+        date_str = _toDateStr(datetime.utcfromtimestamp(timestamp))
+        if timestamp % ONE_DAY < ONE_HOUR and date_str not in prices:
+            prices[date_str] = price
+
+    _cachePrices(from_token, to, prices)
+    return prices
+
+
 def _getTokenHistData(from_token, to, date_str):
     global token_data_cache
 
@@ -26,25 +125,75 @@ def _getTokenHistData(from_token, to, date_str):
     if from_token in token_data_cache:
         if to in token_data_cache[from_token]:
             if date_str in token_data_cache[from_token][to]:
+                instrumentation.countCache('prices', hits=1)
                 return token_data_cache[from_token][to][date_str]
 
-    # No cache, call API
-    price_data = _getCoinHistoryByIdCoinGecko(from_token, date_str)
-    price = price_data['market_data']['current_price'][to]
+    instrumentation.countCache('prices', misses=1)
 
-    # cache it
-    token_data_cache.setdefault(from_token, {to: {}})
-    token_data_cache[from_token][to][date_str] = price
+    # No cache, fill the following days as well, they are likely needed next
+    date_obj = datetime.strptime(date_str, "%d-%m-%Y")
+    prices = _fillTokenHistData(from_token, to, date_obj, date_obj + timedelta(days=PRICE_RANGE_DAYS))
+    if date_str in prices:
+        return prices[date_str]
 
-    return price
+    # Not covered by range data, call API for the day, and cache it
+    return _cacheDayPrice(from_token, to, date_str, _getDayPrice(from_token, to, date_str))
+
+
+def prefetchTokenHistData(from_token, to, timestamps):
+    # Resolve prices of every distinct day up front, so later lookups are in memory only
+    from_token = from_token.lower()
+    to = to.lower()
+
+    cached = token_data_cache.get(from_token, {}).get(to, {})
+    dates = {datetime.fromtimestamp(timestamp).date() for timestamp in timestamps}
+    missing_dates = sorted(dates - {datetime.strptime(date_str, "%d-%m-%Y").date() for date_str in cached})
+    instrumentation.countCache('prices', hits=len(dates) - len(missing_dates), misses=len(missing_dates))
+
+    # Batch missing days into range requests
+    i = 0
+    while i < len(missing_dates):
+        first_date = missing_dates[i]
+        last_date = first_date
+        while i < len(missing_dates) and (missing_dates[i] - first_date).days <= PRICE_RANGE_DAYS:
+            last_date = missing_dates[i]
+            i += 1
+        _fillTokenHistData(from_token, to, first_date, last_date)
+
+    # Days not covered by range data are requested one by one
+    for date_obj in missing_dates:
+        date_str = _toDateStr(date_obj)
+        if date_str not in token_data_cache.get(from_token, {}).get(to, {}):
+            _cacheDayPrice(from_token, to, date_str, _getDayPrice(from_token, to, date_str))
+
+    return len(missing_dates)
 
 
 def getTokenHistData(from_token, to, timestamp):
     datetime_obj = datetime.fromtimestamp(timestamp)
-    date_str = "%02d-%02d-%4d" % (datetime_obj.day, datetime_obj.month, datetime_obj.year)
+    date_str = _toDateStr(datetime_obj)
 
     return _getTokenHistData(from_token, to, date_str)
 
 
 def getEthPrice(timestamp):
     return getTokenHistData('ethereum', 'USD', timestamp)
+
+
+def prefetchEthPrices(timestamps):
+    return prefetchTokenHistData('ethereum', 'USD', timestamps)
+
+
+def getAssetPrice(asset, timestamp):
+    # USD price of an asset of the ledger, WETH is priced as ETH, other ERC-20 tokens by contract address
+    if asset in (ASSET_ETH, ASSET_WETH):
+        return getEthPrice(timestamp)
+
+    return getTokenHistData(asset, 'USD', timestamp)
+
+
+def prefetchAssetPrices(asset, timestamps):
+    if asset in (ASSET_ETH, ASSET_WETH):
+        return prefetchEthPrices(timestamps)
+
+    return prefetchTokenHistData(asset, 'USD', timestamps)
@@ -0,0 +1,126 @@
+from constants import *
+import csv
+import json
+import os
+import sys
+
+# Leveled sink for per-transaction output: descriptions, balance states and tax events
+#   records of each kind are buffered and written to a report file in batches, console messages are buffered
+#   the same way and only shown up to the configured level, nothing is shown by default
+LEVELS = {'quiet': 0, 'info': 1, 'debug': 2}
+LEVEL_QUIET, LEVEL_INFO, LEVEL_DEBUG = 0, 1, 2
+REPORT_FORMATS = ('csv', 'jsonl', 'parquet')
+
+_level = LEVEL_QUIET
+_report_dir = None
+_report_format = 'jsonl'
+_batch_size = REPORT_BATCH_SIZE
+_buffers = {}
+_writers = {}
+_messages = []
+
+
+def _importParquet():
+    # pyarrow is only needed for parquet reports
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise Exception('Parquet reports need pyarrow, install it or choose another report format')
+
+    return pyarrow, pyarrow.parquet
+
+
+def initialize(report_dir=None, report_format='jsonl', level='quiet', batch_size=REPORT_BATCH_SIZE):
+    # Without a report directory, records are not written anywhere
+    global _level, _report_dir, _report_format, _batch_size
+    if report_format not in REPORT_FORMATS:
+        raise Exception('Unknown report format {}'.format(report_format))
+    if level not in LEVELS:
+        raise Exception('Unknown output level {}'.format(level))
+    if report_dir is not None and report_format == 'parquet':
+        _importParquet()
+
+    close()
+    _level = LEVELS[level]
+    _report_dir = report_dir
+    _report_format = report_format
+    _batch_size = batch_size
+    if _report_dir is not None:
+        os.makedirs(_report_dir, exist_ok=True)
+
+
+def emit(kind, record, message=None, level=LEVEL_INFO):
+    if message is not None and level <= _level:
+        _messages.append(message)
+        if len(_messages) >= _batch_size:
+            _flushMessages()
+
+    if _report_dir is None:
+        return
+
+    records = _buffers.setdefault(kind, [])
+    records.append(record)
+    if len(records) >= _batch_size:
+        _flushRecords(kind)
+
+
+def _flushMessages():
+    if _messages:
+        sys.stdout.write('\n'.join(_messages) + '\n')
+        sys.stdout.flush()
+        _messages.clear()
+
+
+def _openWriter(kind, records):
+    report_f = os.path.join(_report_dir, '{}.{}'.format(kind, _report_format))
+    if _report_format == 'parquet':
+        pyarrow, parquet = _importParquet()
+        schema = pyarrow.Table.from_pylist(records).schema
+        return {'writer': parquet.ParquetWriter(report_f, schema), 'schema': schema}
+
+    f = open(report_f, 'w', newline='')
+    if _report_format == 'csv':
+        # columns are those of the first record, all records of a kind share them
+        csv_writer = csv.DictWriter(f, fieldnames=list(records[0]), extrasaction='ignore')
+        csv_writer.writeheader()
+        return {'file': f, 'writer': csv_writer}
+
+    return {'file': f}
+
+
+def _flushRecords(kind):
+    records = _buffers.get(kind)
+    if not records:
+        return
+
+    if kind not in _writers:
+        _writers[kind] = _openWriter(kind, records)
+    writer = _writers[kind]
+
+    if _report_format == 'parquet':
+        pyarrow, _ = _importParquet()
+        writer['writer'].write_table(pyarrow.Table.from_pylist(records, schema=writer['schema']))
+    elif _report_format == 'csv':
+        writer['writer'].writerows(records)
+    else:
+        writer['file'].write(''.join(json.dumps(record) + '\n' for record in records))
+
+    records.clear()
+
+
+def flush():
+    _flushMessages()
+    for kind in list(_buffers):
+        _flushRecords(kind)
+
+
+def close():
+    flush()
+    for writer in _writers.values():
+        if _report_format == 'parquet':
+            writer['writer'].close()
+        else:
+            writer['file'].close()
+    _writers.clear()
+    _buffers.clear()
@@ -0,0 +1,106 @@
+import json
+
+import analyzer
+import priceIO
+from constants import *
+from lotStore import Ledger
+
+ETH = 10 ** WEI_DECIMALS
+
+
+def _txn(timestamp, txn_type, eth=0, gas=0, to=None, tokens=(), nfts=()):
+    return {
+        'type': txn_type,
+        'timestamp': timestamp,
+        'ETH': {'amount': eth, 'to': to},
+        'gas': {'amount': gas},
+        'tokens': list(tokens),
+        'nfts': list(nfts),
+        'description': txn_type,
+    }
+
+
+def _fixedPrices(monkeypatch, eth_price=1000.0, token_prices=None):
+    monkeypatch.setattr(priceIO, 'getEthPrice', lambda timestamp: eth_price)
+    monkeypatch.setattr(priceIO, 'getAssetPrice',
+                        lambda asset, timestamp: (token_prices or {}).get(asset, eth_price))
+
+
+def test_compare_cost_methods_runs_every_method_to_the_end(monkeypatch, tmp_path):
+    # the last transaction yields no state, it is still analyzed and checkpointed for every method
+    _fixedPrices(monkeypatch)
+    checkpoint_f = str(tmp_path / CHECKPOINT_F)
+    txns = [_txn(100, 'buy', ETH), _txn(200, 'transfer_by_coinbase', ETH, to='0xwallet')]
+    ledgers = {COST_METHOD_HIFO: Ledger(COST_METHOD_HIFO), COST_METHOD_FIFO: Ledger(COST_METHOD_FIFO)}
+    temp_coinbase_transfers = {COST_METHOD_HIFO: [], COST_METHOD_FIFO: []}
+
+    states = list(analyzer.iterCompareCostMethods(iter(txns), ledgers, temp_coinbase_transfers, [150, 300],
+                                                  checkpoint_f))
+
+    assert len(states) == 1
+    assert [len(transfers) for transfers in temp_coinbase_transfers.values()] == [1, 1]
+    with open(checkpoint_f) as f:
+        checkpoints = json.load(f)
+    assert {cost_method: [c['timestamp'] for c in method_checkpoints]
+            for cost_method, method_checkpoints in checkpoints.items()} == {COST_METHOD_HIFO: [150, 300],
+                                                                            COST_METHOD_FIFO: [150, 300]}
+
+
+def test_compare_cost_methods_matches_separate_runs(monkeypatch):
+    prices = iter([1000.0, 3000.0, 2000.0, 2500.0])
+    day_prices = {timestamp: next(prices) for timestamp in (100, 200, 300, 400)}
+    monkeypatch.setattr(priceIO, 'getEthPrice', lambda timestamp: day_prices[timestamp])
+    txns = [_txn(100, 'buy', ETH), _txn(200, 'buy', ETH), _txn(300, 'buy', ETH), _txn(400, 'misc_expense', ETH)]
+    cost_methods = [COST_METHOD_HIFO, COST_METHOD_FIFO, COST_METHOD_LIFO, COST_METHOD_AVERAGE]
+
+    compared = analyzer.compareCostMethods(txns, cost_methods)
+
+    for cost_method in cost_methods:
+        separate = analyzer.analyzeEth(txns, cost_method)
+        assert [states[cost_method]['cost_basis'].cost_usd for states in compared] == \
+               [state['cost_basis'].cost_usd for state in separate]
+        assert [states[cost_method]['tax_events'] for states in compared] == \
+               [state['tax_events'] for state in separate]
+    assert compared[-1][COST_METHOD_HIFO]['tax_events'][0]['cost_basis'] == 3000.0
+    assert compared[-1][COST_METHOD_FIFO]['tax_events'][0]['cost_basis'] == 1000.0
+
+
+def test_nft_bought_with_weth_carries_its_cost(monkeypatch):
+    _fixedPrices(monkeypatch, eth_price=2000.0)
+    weth = {'asset': ASSET_WETH, 'symbol': 'WETH', 'decimals': WEI_DECIMALS}
+    nft = {'contract': '0xnft', 'id': '1', 'symbol': 'NFT'}
+    txns = [
+        _txn(100, 'buy', 2 * ETH),
+        _txn(200, 'wrap_ETH', ETH, tokens=[dict(weth, amount=ETH)]),
+        _txn(300, 'buy_nft', 0, tokens=[dict(weth, amount=-ETH // 2)], nfts=[dict(nft, quantity=1)]),
+        _txn(400, 'sell_nft', ETH, nfts=[dict(nft, quantity=-1)]),
+    ]
+
+    states = analyzer.analyzeEth(txns, COST_METHOD_HIFO)
+
+    assert states[2]['nft_cost_usd'] == 1000.0
+    nft_sale = [tax_event for tax_event in states[3]['tax_events'] if tax_event['asset'] == '0xnft-1']
+    assert nft_sale == [{'asset': '0xnft-1', 'cost_basis': 1000.0, 'proceeds': 2000.0}]
+
+
+def test_checkpoint_round_trip(monkeypatch):
+    _fixedPrices(monkeypatch)
+    ledger = Ledger(COST_METHOD_LIFO)
+    temp_coinbase_transfers = []
+    txns = [_txn(100, 'buy', 2 * ETH), _txn(200, 'transfer_by_coinbase', ETH, to='0xwallet')]
+    list(analyzer.iterAnalyzeEth(txns, COST_METHOD_LIFO, ledger, temp_coinbase_transfers))
+
+    checkpoint = json.loads(json.dumps(analyzer.createCheckpoint(200, ledger, temp_coinbase_transfers)))
+    opened_ledger, opened_transfers = analyzer.openCheckpoint(checkpoint, COST_METHOD_LIFO)
+
+    assert checkpoint['version'] == CHECKPOINT_VERSION
+    assert opened_ledger.dump() == ledger.dump()
+    assert opened_transfers == temp_coinbase_transfers
+
+
+def test_open_without_checkpoint():
+    ledger, temp_coinbase_transfers = analyzer.openCheckpoint(None, COST_METHOD_FIFO)
+
+    assert ledger.cost_method == COST_METHOD_FIFO
+    assert ledger.lotStore(ASSET_ETH).balance == 0
+    assert temp_coinbase_transfers == []
@@ -0,0 +1,7 @@
+import coinbaseRetriever
+
+
+def test_parse_timestamps_as_utc():
+    timestamps = ['2021-05-01T12:00:00Z', '2021-05-01 12:00:00 UTC', '2021-05-01T12:00:00', '2021-05-01T12:00:00Z']
+
+    assert coinbaseRetriever._parseTimestamps(timestamps) == [1619870400] * 4
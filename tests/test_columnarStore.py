@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+import columnarStore
+from constants import *
+
+
+def _txnGroup(erc1155_counts, eth_value='1500000000000000000'):
+    return {
+        'txn_hash': '0xhash',
+        'timeStamp': '1600000000',
+        'txn_normal': [{'from': '0xa', 'to': '0xb', 'value': eth_value, 'gasPrice': '10', 'gasUsed': '21000'}],
+        'txn_internal': [],
+        'txn_erc20': [{'from': '0xb', 'to': '0xa', 'value': '2500000', 'tokenDecimal': '6',
+                       'contractAddress': '0xusdc'}],
+        'txn_erc721': [],
+        'txn_erc1155': [{'from': '0xb', 'to': '0xa', 'tokenName': count, 'contractAddress': '0xnft'}
+                        for count in erc1155_counts],
+    }
+
+
+def test_amounts_are_exact_integers():
+    columns = columnarStore.buildTransferColumns([_txnGroup([])])
+
+    assert columns['value_units'].tolist() == [1500000000000000000, 2500000]
+    assert columns['value'].tolist() == [1.5, 2.5]
+    assert columns['gas_wei'].tolist() == [210000, 0]
+
+
+def test_erc1155_counts_parsed_as_numbers():
+    columns = columnarStore.buildTransferColumns([_txnGroup(['1', '2.0', ' 3', '1e2', '2.5'])])
+    is_count = columns['kind'] == columnarStore.KIND_ERC1155
+
+    assert columns['value_units'][is_count].tolist() == [1, 2, 3, 100, 2.5]
+    assert [type(count) for count in columns['value_units'][is_count].tolist()[:4]] == [int] * 4
+    assert columns['value'][is_count].dtype == np.float64
+
+
+def test_malformed_erc1155_count_fails_as_float_does():
+    with pytest.raises(ValueError):
+        columnarStore.buildTransferColumns([_txnGroup(['1', 'many'])])
@@ -0,0 +1,37 @@
+import json
+
+import web3
+
+import contractHelper
+
+
+def _selector(signature):
+    return web3.Web3.to_hex(web3.Web3.keccak(text=signature)[:4])
+
+
+def _contract(*functions):
+    abi = [{'type': 'function', 'name': name, 'inputs': [{'type': t} for t in input_types]}
+           for name, input_types in functions]
+    return {'SourceCode': 'contract', 'ABI': json.dumps(abi)}
+
+
+def test_find_function_from_own_abi():
+    contract = _contract(('deposit', []), ('withdraw', ['uint256']))
+
+    assert contractHelper.findFunction(contract, _selector('withdraw(uint256)') + '00' * 32) == 'withdraw'
+    assert contractHelper.findFunction(contract, _selector('deposit()')) == 'deposit'
+
+
+def test_find_function_ignores_other_contracts():
+    # a function of another contract seen earlier never describes a call to this one
+    other_contract = _contract(('transfer', ['address', 'uint256']))
+    contractHelper.findFunction(other_contract, _selector('transfer(address,uint256)'))
+    contract = _contract(('deposit', []))
+
+    assert contractHelper.findFunction(contract, _selector('transfer(address,uint256)')) == ''
+
+
+def test_unverified_contract_has_no_functions():
+    contract = {'SourceCode': '', 'ABI': 'Contract source code not verified'}
+
+    assert contractHelper.findFunction(contract, _selector('deposit()')) == ''
@@ -0,0 +1,42 @@
+import ethTransactionsRetriever as ethTxnsRetriever
+from constants import *
+
+
+def _fakeEtherscan(monkeypatch, failing_func=None):
+    def callApi(func_name, wallet, start_block, end_block, sort):
+        if func_name == failing_func:
+            raise Exception('Etherscan unavailable')
+        if func_name == 'get_normal_txs_by_address':
+            return [{'blockNumber': str(block), 'timeStamp': str(block)} for block in range(start_block, end_block + 1)]
+        raise AssertionError('No transactions found')
+
+    monkeypatch.setattr(ethTxnsRetriever.etherscan, 'callApi', callApi)
+    monkeypatch.setattr(ethTxnsRetriever, '_failed_syncs', set())
+
+
+def _syncWallet(sync_state, start_block, end_block):
+    wallet_txns = ethTxnsRetriever.iterWalletTxns('0xwallet', '', start_block, end_block, sync_state, erc1155_txns=[])
+    return [list(txns) for txns in wallet_txns]
+
+
+def test_synced_block_ranges(monkeypatch):
+    _fakeEtherscan(monkeypatch)
+    sync_state = {}
+
+    _syncWallet(sync_state, 10, 20)
+    normal_txns = _syncWallet(sync_state, 5, 25)[0]
+
+    assert [t['blockNumber'] for t in normal_txns] == ['5', '6', '7', '8', '9', '21', '22', '23', '24', '25']
+    assert sync_state['0xwallet']['normal'] == {'first_block': 5, 'last_block': 25}
+    assert not ethTxnsRetriever.hasFailedSyncs()
+
+
+def test_failed_endpoint_is_not_marked_synced(monkeypatch):
+    _fakeEtherscan(monkeypatch, failing_func='get_internal_txs_by_address')
+    sync_state = {}
+
+    _syncWallet(sync_state, 10, 20)
+
+    assert 'internal' not in sync_state['0xwallet']
+    assert sync_state['0xwallet']['normal'] == {'first_block': 10, 'last_block': 20}
+    assert ethTxnsRetriever.hasFailedSyncs()
@@ -0,0 +1,30 @@
+import etherscanIO
+
+VERIFIED = '0x' + 'a' * 40
+UNVERIFIED = '0x' + 'b' * 40
+
+
+def test_only_verified_contracts_are_cached_on_disk(monkeypatch, tmp_path):
+    contracts = {VERIFIED: {'SourceCode': 'contract', 'ABI': '[]'},
+                 UNVERIFIED: {'SourceCode': '', 'ABI': 'Contract source code not verified'}}
+    lookups = []
+
+    def callApi(func_name, address):
+        lookups.append(address)
+        return [dict(contracts[address])]
+
+    monkeypatch.setattr(etherscanIO, 'callApi', callApi)
+    etherscanIO.initialize('', str(tmp_path) + '/')
+    try:
+        for address in (VERIFIED, UNVERIFIED):
+            etherscanIO.getContract(address)
+        # a new run, nothing in memory
+        etherscanIO.getContract.cache_clear()
+        for address in (VERIFIED, UNVERIFIED):
+            etherscanIO.getContract(address)
+    finally:
+        etherscanIO.getContract.cache_clear()
+        etherscanIO.contract_db.close()
+        monkeypatch.setattr(etherscanIO, 'contract_db', None)
+
+    assert lookups == [VERIFIED, UNVERIFIED, UNVERIFIED]
@@ -0,0 +1,71 @@
+import analyzer
+import fileIO
+from constants import *
+from lotStore import Ledger
+
+
+def _cacheCheckpoint(checkpoint_f, cost_method, timestamp):
+    fileIO.cacheCheckpoint(analyzer.createCheckpoint(timestamp, Ledger(cost_method), []), checkpoint_f)
+
+
+def test_read_checkpoint_latest_before_timestamp(tmp_path):
+    checkpoint_f = str(tmp_path / CHECKPOINT_F)
+    for timestamp in (300, 100, 200):
+        _cacheCheckpoint(checkpoint_f, COST_METHOD_HIFO, timestamp)
+
+    assert fileIO.readCheckpoint(checkpoint_f, COST_METHOD_HIFO, 250)['timestamp'] == 200
+    assert fileIO.readCheckpoint(checkpoint_f, COST_METHOD_HIFO, 50) is None
+    assert fileIO.readCheckpoint(checkpoint_f, COST_METHOD_FIFO, 250) is None
+
+
+def test_read_checkpoint_ignores_other_versions(tmp_path):
+    checkpoint_f = str(tmp_path / CHECKPOINT_F)
+    _cacheCheckpoint(checkpoint_f, COST_METHOD_HIFO, 100)
+    checkpoint = analyzer.createCheckpoint(200, Ledger(COST_METHOD_HIFO), [])
+    checkpoint['version'] = CHECKPOINT_VERSION - 1
+    fileIO.cacheCheckpoint(checkpoint, checkpoint_f)
+
+    assert fileIO.readCheckpoint(checkpoint_f, COST_METHOD_HIFO, 250)['timestamp'] == 100
+
+
+def test_read_common_checkpoints_falls_back_to_shared_timestamp(tmp_path):
+    checkpoint_f = str(tmp_path / CHECKPOINT_F)
+    for timestamp in (100, 200, 300):
+        _cacheCheckpoint(checkpoint_f, COST_METHOD_HIFO, timestamp)
+    for timestamp in (100, 250):
+        _cacheCheckpoint(checkpoint_f, COST_METHOD_FIFO, timestamp)
+
+    checkpoints = fileIO.readCommonCheckpoints(checkpoint_f, [COST_METHOD_HIFO, COST_METHOD_FIFO], 400)
+
+    assert {cost_method: c['timestamp'] for cost_method, c in checkpoints.items()} == {COST_METHOD_HIFO: 100,
+                                                                                      COST_METHOD_FIFO: 100}
+    assert fileIO.readCommonCheckpoints(checkpoint_f, [COST_METHOD_HIFO], 400)[COST_METHOD_HIFO]['timestamp'] == 300
+    assert fileIO.readCommonCheckpoints(checkpoint_f, [COST_METHOD_HIFO, COST_METHOD_LIFO], 400) is None
+
+
+def _dataPath(tmp_path):
+    for data_dir in ('Coinbase', 'ERC1155'):
+        (tmp_path / data_dir).mkdir()
+    (tmp_path / 'Coinbase' / 'report.csv').write_text("Timestamp,Transaction Type\n")
+    return str(tmp_path) + '/'
+
+
+def test_read_checkpoint_ignores_other_inputs(tmp_path):
+    data_path = _dataPath(tmp_path)
+    checkpoint_f = data_path + CHECKPOINT_F
+    wallets = ['0x' + '1' * 40]
+    inputs = fileIO.getCheckpointInputs(wallets, data_path)
+    fileIO.cacheCheckpoint(analyzer.createCheckpoint(100, Ledger(COST_METHOD_HIFO), [], inputs), checkpoint_f)
+
+    assert fileIO.readCheckpoint(checkpoint_f, COST_METHOD_HIFO, 250, inputs)['timestamp'] == 100
+    assert fileIO.getCheckpointInputs([wallet.upper() for wallet in wallets], data_path) == inputs
+
+    # a wallet added
+    other_inputs = fileIO.getCheckpointInputs(wallets + ['0x' + '2' * 40], data_path)
+    assert fileIO.readCheckpoint(checkpoint_f, COST_METHOD_HIFO, 250, other_inputs) is None
+
+    # an ERC-1155 export added
+    (tmp_path / 'ERC1155' / (wallets[0] + '.csv')).write_text("Txhash\n")
+    other_inputs = fileIO.getCheckpointInputs(wallets, data_path)
+    assert other_inputs['wallets'] == inputs['wallets']
+    assert fileIO.readCommonCheckpoints(checkpoint_f, [COST_METHOD_HIFO], 250, other_inputs) is None
@@ -0,0 +1,87 @@
+import pytest
+
+from constants import *
+from lotStore import LotStore, Ledger, createLotStore, loadLedger, loadLotStore
+
+ETH = 10 ** WEI_DECIMALS
+
+
+def _lotStore(cost_method):
+    # three lots of 1 ETH, bought at 2000, 3000 then 1000 USD
+    lot_store = createLotStore(cost_method)
+    for unit_price_usd in (2000.0, 3000.0, 1000.0):
+        lot_store.add(ETH, unit_price_usd)
+    return lot_store
+
+
+@pytest.mark.parametrize('cost_method, unit_prices', [
+    (COST_METHOD_HIFO, [3000.0, 2000.0]),
+    (COST_METHOD_FIFO, [2000.0, 3000.0]),
+    (COST_METHOD_LIFO, [1000.0, 3000.0]),
+    (COST_METHOD_AVERAGE, [2000.0]),
+])
+def test_lots_consumed_in_order_of_cost_method(cost_method, unit_prices):
+    lot_store = _lotStore(cost_method)
+
+    cost_reduced = lot_store.consume(ETH + ETH // 2)
+
+    assert [c['unit_price_usd'] for c in cost_reduced] == unit_prices
+    assert sum(c['amount'] for c in cost_reduced) == ETH + ETH // 2
+    assert lot_store.balance == 3 * ETH - (ETH + ETH // 2)
+    assert lot_store.cost_usd == pytest.approx(6000.0 - sum(c['amount'] * c['unit_price_usd'] / ETH
+                                                            for c in cost_reduced))
+
+
+@pytest.mark.parametrize('cost_method', [COST_METHOD_HIFO, COST_METHOD_FIFO, COST_METHOD_LIFO, COST_METHOD_AVERAGE])
+def test_consuming_more_than_balance_fails(cost_method):
+    lot_store = _lotStore(cost_method)
+
+    with pytest.raises(Exception, match='Not enough ETH'):
+        lot_store.consume(4 * ETH)
+    assert lot_store.balance == 3 * ETH
+
+
+@pytest.mark.parametrize('cost_method', [COST_METHOD_HIFO, COST_METHOD_FIFO, COST_METHOD_LIFO, COST_METHOD_AVERAGE])
+def test_snapshot_is_not_changed_by_later_operations(cost_method):
+    lot_store = _lotStore(cost_method)
+    snapshot = lot_store.snapshot()
+    lots = snapshot.toList()
+
+    lot_store.consume(ETH + ETH // 2)
+    lot_store.increaseCost(100.0)
+    lot_store.add(ETH, 5000.0)
+
+    assert snapshot.toList() == lots
+    assert (snapshot.balance, snapshot.cost_usd) == (3 * ETH, 6000.0)
+
+
+@pytest.mark.parametrize('cost_method', [COST_METHOD_HIFO, COST_METHOD_FIFO, COST_METHOD_LIFO, COST_METHOD_AVERAGE])
+def test_loaded_lot_store_consumes_in_same_order(cost_method):
+    lot_store = _lotStore(cost_method)
+    lot_store.consume(ETH // 2)
+
+    loaded = loadLotStore(lot_store.dump())
+
+    assert loaded.toList() == lot_store.toList()
+    assert (loaded.balance, loaded.cost_usd) == (lot_store.balance, lot_store.cost_usd)
+    assert loaded.consume(2 * ETH) == lot_store.consume(2 * ETH)
+
+
+def test_lot_store_base_is_abstract():
+    with pytest.raises(TypeError):
+        LotStore()
+    with pytest.raises(Exception, match='Unknown cost method'):
+        createLotStore('LOWEST')
+
+
+def test_ledger_round_trip():
+    ledger = Ledger(COST_METHOD_FIFO)
+    ledger.lotStore(ASSET_ETH).add(2 * ETH, 2000.0)
+    ledger.lotStore('0xtoken', 6).add(5 * 10 ** 6, 1.0)
+    ledger.nfts.add('0xnft', '7', 1, 300.0)
+
+    loaded = loadLedger(ledger.dump())
+
+    assert loaded.dump() == ledger.dump()
+    assert loaded.lotStore('0xtoken').decimals == 6
+    assert loaded.nfts.remove('0xnft', '7', 1) == 300.0
@@ -0,0 +1,53 @@
+import calendar
+
+import pytest
+
+import priceIO
+from constants import *
+
+TIMESTAMP = calendar.timegm((2022, 3, 10, 12, 0, 0))
+DAY_TIMESTAMP = calendar.timegm((2022, 3, 10, 0, 0, 0))
+
+
+@pytest.fixture
+def priceCache(monkeypatch, tmp_path):
+    monkeypatch.setattr(priceIO, 'token_data_cache', {})
+    priceIO.initialize(str(tmp_path) + '/')
+    yield tmp_path
+    priceIO.price_db.close()
+
+
+def _fakeContractChart(monkeypatch, prices):
+    calls = []
+
+    def getContractMarketChartRange(contract, to, from_timestamp, to_timestamp):
+        calls.append(contract)
+        return {'prices': prices}
+
+    monkeypatch.setattr(priceIO, '_getContractMarketChartRangeCoinGecko', getContractMarketChartRange)
+    return calls
+
+
+def test_missing_token_price_is_not_persisted(monkeypatch, priceCache):
+    calls = _fakeContractChart(monkeypatch, [])
+
+    assert priceIO.getAssetPrice('0xtoken', TIMESTAMP) == 0.0
+    assert priceIO.getAssetPrice('0xtoken', TIMESTAMP) == 0.0
+    assert len(calls) == 1
+    assert priceIO.price_db.execute('SELECT COUNT(*) FROM prices').fetchone()[0] == 0
+
+    # a later run requests the price again
+    priceIO.price_db.close()
+    monkeypatch.setattr(priceIO, 'token_data_cache', {})
+    priceIO.initialize(str(priceCache) + '/')
+    _fakeContractChart(monkeypatch, [[DAY_TIMESTAMP * 1000, 1.25]])
+
+    assert priceIO.getAssetPrice('0xtoken', TIMESTAMP) == 1.25
+
+
+def test_prefetched_prices_are_persisted(monkeypatch, priceCache):
+    _fakeContractChart(monkeypatch, [[DAY_TIMESTAMP * 1000, 1.25]])
+
+    priceIO.prefetchAssetPrices('0xtoken', [TIMESTAMP])
+
+    assert priceIO.price_db.execute('SELECT token, price FROM prices').fetchall() == [('0xtoken', 1.25)]
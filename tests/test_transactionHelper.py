@@ -0,0 +1,116 @@
+import json
+
+import pytest
+import web3
+
+import columnarStore
+import transactionHelper as txnHelper
+
+WALLET = '0x' + '1' * 40
+MARKETPLACE = '0x' + 'a' * 40
+VAULT = '0x' + 'b' * 40
+BID_SELECTOR = web3.Web3.to_hex(web3.Web3.keccak(text='bid(address)')[:4])
+
+
+def _contract(*function_names):
+    abi = [{'type': 'function', 'name': name, 'inputs': [{'type': 'address'}]} for name in function_names]
+    return {'SourceCode': 'contract', 'ABI': json.dumps(abi)}
+
+
+# the vault's ABI doesn't list the marketplace's function, failed calls to it with that selector have no function name
+CONTRACTS = {MARKETPLACE: _contract('bid'), VAULT: _contract('deposit')}
+
+
+def _normalTxn(i, addr_to, is_error):
+    return {
+        'blockNumber': str(100 + i),
+        'timeStamp': str(1600000000 + i),
+        'hash': '0x{:064x}'.format(i),
+        'from': WALLET,
+        'to': addr_to,
+        'value': str(10 ** 17),
+        'gas': '250000',
+        'gasPrice': str(50 * 10 ** 9),
+        'gasUsed': '100000',
+        'isError': is_error,
+        'input': BID_SELECTOR + '0' * 64,
+        'contractAddress': '',
+    }
+
+
+def _txnGroups():
+    normal_txns = [_normalTxn(i, addr_to, is_error)
+                   for i, (addr_to, is_error) in enumerate([(MARKETPLACE, '0'), (VAULT, '1'), (MARKETPLACE, '0'),
+                                                            (VAULT, '1')])]
+    txn_groups = list(txnHelper.iterTxnGroups({WALLET: (normal_txns, [], [], [], [])}))
+    return txnHelper.enrichTxns(txn_groups)
+
+
+def _fakeGetContract(monkeypatch):
+    lookups = []
+
+    def getContract(address):
+        lookups.append(address)
+        return json.loads(json.dumps(CONTRACTS[address]))
+
+    monkeypatch.setattr(txnHelper, 'getContract', getContract)
+    return lookups
+
+
+def test_parallel_describe_matches_serial(monkeypatch):
+    serial_lookups = _fakeGetContract(monkeypatch)
+    serial = [description for _, description in
+              ((txn['timestamp'], txnHelper._describeEtherscanTxn(txn, [WALLET])) for txn in _txnGroups())]
+
+    parallel_lookups = _fakeGetContract(monkeypatch)
+    parallel = [description for _, description in
+                txnHelper._iterDescribeEtherscanTxnsParallel(_txnGroups(), [WALLET], max_workers=2, chunk_size=1)]
+
+    assert parallel == serial
+    assert serial[0]['description'].startswith('Function bid cost')
+    assert serial[1]['description'].startswith('Function  failed')
+    # only the contracts the serial path looks up are resolved
+    assert set(parallel_lookups) == set(serial_lookups)
+
+
+def _page(confirmations):
+    txn_hash = '0x{:064x}'.format(1)
+    normal_txn = dict(_normalTxn(1, MARKETPLACE, '0'), confirmations=str(confirmations))
+    internal_txn = {'hash': txn_hash, 'traceId': '0', 'from': MARKETPLACE, 'to': WALLET, 'value': str(10 ** 16),
+                    'confirmations': str(confirmations)}
+    erc20_txn = {'hash': txn_hash, 'logIndex': '7', 'contractAddress': VAULT, 'from': MARKETPLACE, 'to': WALLET,
+                 'value': '5', 'confirmations': str(confirmations)}
+    return {txn_hash: {'wallet': WALLET, 'txn_normal': [normal_txn], 'txn_internal': [internal_txn],
+                       'txn_erc20': [erc20_txn], 'txn_erc721': [], 'txn_erc1155': []}}
+
+
+def test_merge_overlapping_page_keeps_rows_once():
+    txn_groups_by_hash = {}
+    assert txnHelper.mergeTxnGroups(txn_groups_by_hash, _page(confirmations=10)) == 1
+
+    # the same rows retrieved again, only their confirmations have changed
+    assert txnHelper.mergeTxnGroups(txn_groups_by_hash, _page(confirmations=25)) == 0
+
+    txn_grouped, = txn_groups_by_hash.values()
+    for group_key in ('txn_normal', 'txn_internal', 'txn_erc20'):
+        assert len(txn_grouped[group_key]) == 1
+
+    # another log entry of the same transaction is a new row
+    new_page = _page(confirmations=30)
+    new_page[next(iter(new_page))]['txn_erc20'][0]['logIndex'] = '8'
+    assert txnHelper.mergeTxnGroups(txn_groups_by_hash, new_page) == 1
+    assert len(txn_grouped['txn_erc20']) == 2
+
+
+def test_gas_by_month_summed_over_enrichment_columns():
+    normal_txns = [_normalTxn(i, MARKETPLACE, '0') for i in range(4)]
+    txn_groups = txnHelper.iterTxnGroups({WALLET: (normal_txns, [], [], [], [])})
+    gas_by_month = {}
+
+    def addGasByMonth(columns):
+        columnarStore.addGasByMonth(columns, [WALLET], gas_by_month, end_timestamp=1600000002)
+
+    txn_groups = list(txnHelper.iterEnrichTxns(txn_groups, batch_size=3, on_columns=addGasByMonth))
+
+    assert [t['Normal']['gas']['amount'] for t in txn_groups] == [50 * 10 ** 9 * 100000] * 4
+    assert gas_by_month == {'2020-09': pytest.approx(0.015)}
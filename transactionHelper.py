@@ -1,8 +1,28 @@
 from etherscanIO import *
 from contractHelper import *
 from constants import *
+from columnarStore import buildTransferColumns, TRANSFER_KINDS
+from amounts import formatUnits, parseUnits, toUnits
+from concurrent.futures import ProcessPoolExecutor
+import etherscanIO
+import fileIO
 import priceIO
-from web3 import Web3
+import reportWriter
+import collections
+import heapq
+import itertools
+import os
+
+# Contracts resolved by the parent process, for describing in worker processes
+_contracts = {}
+_is_describe_worker = False
+
+
+class _MissingContract(Exception):
+    # A worker process needs a contract the parent process has not resolved yet
+    def __init__(self, address):
+        super().__init__(address)
+        self.address = address
 
 
 def groupByNormalTxns(txn_hash: str,
@@ -24,7 +44,121 @@ def groupByNormalTxns(txn_hash: str,
     })
 
 
-def _procesEthAndGasTxns(txns: list, timestamp: int) -> dict:
+def _rowKey(group_key, txn):
+    # Identity of a retrieved row, from fields that never change, e.g. not Etherscan confirmations
+    #   a normal transaction is its hash, a token transfer its log entry, internal transactions have no index
+    match group_key:
+        case 'txn_normal':
+            return txn['hash']
+        case 'txn_internal':
+            return txn['hash'], txn.get('traceId'), txn['from'], txn['to'], txn['value']
+        case 'txn_erc1155':
+            return txn['hash'], txn['contractAddress'], txn['tokenId'], txn['from'], txn['to'], txn['tokenName']
+        case _:
+            return (txn['hash'], txn.get('logIndex'), txn['contractAddress'], txn['from'], txn['to'],
+                    txn.get('value'), txn.get('tokenID'))
+
+
+def mergeTxnGroups(txn_groups_by_hash: dict, new_txn_groups_by_hash: dict) -> int:
+    # Merge newly retrieved transaction groups into cached groups
+    #   rows of a hash already cached (by the same wallet) are appended, unless the same row is cached already,
+    #   e.g. a block range retrieved again after a failure
+    #   groups are cached as retrieved and enriched when read, exact amounts don't fit msgpack integers
+    txn_count = 0
+    for txn_hash, new_txn_grouped in new_txn_groups_by_hash.items():
+        txn_grouped = txn_groups_by_hash.get(txn_hash)
+        if txn_grouped is None:
+            txn_groups_by_hash[txn_hash] = new_txn_grouped
+            txn_count += 1
+            continue
+
+        # a transaction hash is owned by the first wallet it is seen from
+        if txn_grouped.get('wallet') != new_txn_grouped['wallet']:
+            continue
+
+        is_updated = False
+        for group_key in ('txn_normal', 'txn_internal', 'txn_erc20', 'txn_erc721', 'txn_erc1155'):
+            row_keys = {_rowKey(group_key, txn) for txn in txn_grouped[group_key]}
+            for txn in new_txn_grouped[group_key]:
+                row_key = _rowKey(group_key, txn)
+                if row_key not in row_keys:
+                    row_keys.add(row_key)
+                    txn_grouped[group_key].append(txn)
+                    is_updated = True
+
+        if is_updated:
+            txn_count += 1
+
+    return txn_count
+
+
+def iterTxnGroups(wallets_txns: dict):
+    # Group transfers of all wallets by transaction hash, as they stream in ascending timestamp order
+    #   transfers of a transaction share its timestamp, so only transfers of the current timestamp are held
+    #   streams are merged in wallet order, then type order, so a transaction hash is owned by the first wallet
+    #   it is seen from, and its group is created by its first transfer (normal, internal, ERC-20, ERC-721, ERC-1155)
+    def tagTxns(txns, wallet, group_key):
+        for txn in txns:
+            yield int(txn['timeStamp']), wallet, group_key, txn
+
+    streams = [tagTxns(txns, wallet, group_key)
+               for wallet, wallet_txns in wallets_txns.items()
+               for group_key, txns in zip(TRANSFER_KINDS, wallet_txns)]
+
+    merged = heapq.merge(*streams, key=lambda item: item[0])
+    for _, same_time_txns in itertools.groupby(merged, key=lambda item: item[0]):
+        txn_groups_by_hash = {}
+        for _, wallet, group_key, txn in same_time_txns:
+            txn_grouped = txn_groups_by_hash.get(txn['hash'])
+            if txn_grouped is None:
+                txn_grouped = txn_groups_by_hash[txn['hash']] = {
+                    'txn_hash': txn['hash'],
+                    'timeStamp': txn['timeStamp'],
+                    'wallet': wallet,
+                    'txn_normal': [],
+                    'txn_internal': [],
+                    'txn_erc20': [],
+                    'txn_erc721': [],
+                    'txn_erc1155': []
+                }
+            elif txn_grouped['wallet'] != wallet:
+                continue
+            txn_grouped[group_key].append(txn)
+
+        yield from txn_groups_by_hash.values()
+
+
+def iterEnrichTxns(txn_groups, batch_size=ENRICH_BATCH_SIZE, on_columns=None):
+    # Enrich streamed transaction groups a batch at a time, columns are built per batch
+    #   and handed to on_columns as well, for aggregates over the same batch (see columnarStore.addGasByMonth)
+    txn_groups = iter(txn_groups)
+    while True:
+        batch = list(itertools.islice(txn_groups, batch_size))
+        if not batch:
+            return
+        columns = buildTransferColumns(batch)
+        if on_columns is not None:
+            on_columns(columns)
+        yield from enrichTxns(batch, columns)
+
+
+def syncTxnGroupsToCache(new_txn_groups, cache_dir) -> int:
+    # Merge streamed transaction groups into the cache, one month at a time
+    #   groups stream in timestamp order, so a month is complete once the next one starts,
+    #   only its shards are loaded and rewritten before moving on
+    txn_count = 0
+    for months, month_txn_groups in itertools.groupby(new_txn_groups, key=lambda t: fileIO.getCacheMonths([t])):
+        new_txn_groups_by_hash = {t['txn_hash']: t for t in month_txn_groups}
+        txn_groups_by_hash = {t['txn_hash']: t for t in fileIO.readTransactionsCache(cache_dir, months=months)}
+        month_txn_count = mergeTxnGroups(txn_groups_by_hash, new_txn_groups_by_hash)
+        if month_txn_count:
+            fileIO.cacheTransactions(list(txn_groups_by_hash.values()), cache_dir)
+        txn_count += month_txn_count
+
+    return txn_count
+
+
+def _procesEthAndGasTxns(txns: list, eth_amounts: list, gas_amounts: list) -> dict:
     # Process gas and ETH
     if len(txns) > 1:
         raise Exception("Two normal transactions for the same hash")
@@ -32,34 +166,27 @@ def _procesEthAndGasTxns(txns: list, timestamp: int) -> dict:
         return {}
     else:  # len = 1
         txn = txns[0]
-        if 'gasPrice' not in txn:
-            gas_amount = 0
-        else:
-            gas_amount = float(Web3.fromWei(int(txn['gasPrice']) * int(txn['gasUsed']), 'ether'))
-        eth_amount = float(Web3.fromWei(int(txn['value']), 'ether'))
 
         # Add gas and ETH details of the given transaction
-        # amount is in ether
+        # amounts are in wei
         return {
             'gas': {
-                'amount': gas_amount,
+                'amount': gas_amounts[0],
             },
             'ETH': {
-                'amount': eth_amount,
+                'amount': eth_amounts[0],
                 'from': txn['from'],
                 'to': txn['to']
             },
         }
 
 
-def _processErc20Txns(txns_erc20: list) -> dict:
+def _processErc20Txns(txns_erc20: list, values: list, decimals: list) -> dict:
     erc20_summary = []
-    for txn in txns_erc20:
-        # tokenDecimal is token precision
-        # value represents integer to the most precise digit of the token
-        decimal = 18 if not txn['tokenDecimal'] else int(txn['tokenDecimal'])
+    for txn, value, token_decimals in zip(txns_erc20, values, decimals):
         erc20_summary.append({
-            'value': float(txn['value']) / pow(10, decimal),
+            'value': value,
+            'decimals': token_decimals,
             'contract': txn['contractAddress'],
             'name': txn['tokenName'],
             'symbol': txn['tokenSymbol'],
@@ -70,12 +197,11 @@ def _processErc20Txns(txns_erc20: list) -> dict:
     return {'ERC-20': erc20_summary}
 
 
-def _processErc721Txns(txns_erc721: list) -> dict:
+def _processErc721Txns(txns_erc721: list, values: list) -> dict:
     erc721_summary = []
-    for txn in txns_erc721:
-        # ERC-721 token is unique
+    for txn, value in zip(txns_erc721, values):
         erc721_summary.append({
-            'value': 1.0,
+            'value': value,
             'contract': txn['contractAddress'],
             'name': txn['tokenName'],
             'symbol': txn['tokenSymbol'],
@@ -87,12 +213,11 @@ def _processErc721Txns(txns_erc721: list) -> dict:
     return {'ERC-721': erc721_summary}
 
 
-def _processErc1155Txns(txns_erc1155: list) -> dict:
+def _processErc1155Txns(txns_erc1155: list, values: list) -> dict:
     erc1155_summary = []
-    for txn in txns_erc1155:
-        # TokenName represents count of 1155 token
+    for txn, value in zip(txns_erc1155, values):
         erc1155_summary.append({
-            'value': float(txn['tokenName']),
+            'value': value,
             'contract': txn['contractAddress'],
             'name': txn['tokenSymbol'],
             'symbol': txn['tokenSymbol'],
@@ -104,42 +229,69 @@ def _processErc1155Txns(txns_erc1155: list) -> dict:
     return {'ERC-1155': erc1155_summary}
 
 
-def enrichTxn(txn_grouped: dict) -> dict:
-    txn_grouped_enriched = txn_grouped
-    txn_grouped['timestamp'] = int(txn_grouped['timeStamp'])
+def enrichTxns(txn_groups: list, columns=None) -> list:
+    # Amounts of every transfer are converted at once, as columns (see columnarStore), unless already built
+    #   columns list rows by group, then by transfer type, so each group takes the next slice of every type
+    if columns is None:
+        columns = buildTransferColumns(txn_groups)
+    #   ETH, gas and ERC-20 amounts are exact integers in base units, ERC-721 and ERC-1155 values are counts
+    values = columns['value_units'].tolist()
+    decimals = columns['decimals'].tolist()
+    gas_amounts = columns['gas_wei'].tolist()
+
+    row = 0
+    for txn_grouped in txn_groups:
+        txn_grouped['timestamp'] = int(txn_grouped['timeStamp'])
+        row_slices = []
+        for group_key in TRANSFER_KINDS:
+            row_end = row + len(txn_grouped[group_key])
+            row_slices.append(slice(row, row_end))
+            row = row_end
+        normal_rows, internal_rows, erc20_rows, erc721_rows, erc1155_rows = row_slices
+
+        # Process gas and ETH from normal txn
+        normal_txn_summary = _procesEthAndGasTxns(txn_grouped['txn_normal'], values[normal_rows],
+                                                  gas_amounts[normal_rows])
+        txn_grouped.update({'Normal': normal_txn_summary})
+
+        # Process internal transactions
+        internal_txn_summary = _procesEthAndGasTxns(txn_grouped['txn_internal'], values[internal_rows],
+                                                    gas_amounts[internal_rows])
+        txn_grouped.update({'Internal': internal_txn_summary})
 
-    # Process gas and ETH from normal txn
-    normal_txn_summary = _procesEthAndGasTxns(txn_grouped['txn_normal'], txn_grouped['timestamp'])
-    txn_grouped_enriched.update({'Normal': normal_txn_summary})
+        # TODO also extract gas from NFT transactions "0x9e509920f8679fda8a5f57e72a97b1198cc8b91a6cf7667ad82b7e36c34697ed"
+        # Process ERC-20 tokens in transaction
+        txn_grouped.update(_processErc20Txns(txn_grouped['txn_erc20'], values[erc20_rows],
+                                             decimals[erc20_rows]))
 
-    # Process internal transactions
-    internal_txn_summary = _procesEthAndGasTxns(txn_grouped['txn_internal'], txn_grouped['timestamp'])
-    txn_grouped_enriched.update({'Internal': internal_txn_summary})
+        # Process ERC-721 tokens in transaction
+        txn_grouped.update(_processErc721Txns(txn_grouped['txn_erc721'], values[erc721_rows]))
 
-    # TODO also extract gas from NFT transactions "0x9e509920f8679fda8a5f57e72a97b1198cc8b91a6cf7667ad82b7e36c34697ed"
-    # Process ERC-20 tokens in transaction
-    erc20_summary = _processErc20Txns(txn_grouped['txn_erc20'])
-    txn_grouped_enriched.update(erc20_summary)
+        # Process ERC-1155 tokens in transaction
+        txn_grouped.update(_processErc1155Txns(txn_grouped['txn_erc1155'], values[erc1155_rows]))
 
-    # Process ERC-721 tokens in transaction
-    erc721_summary = _processErc721Txns(txn_grouped['txn_erc721'])
-    txn_grouped_enriched.update(erc721_summary)
+    return txn_groups
 
-    # Process ERC-1155 tokens in transaction
-    erc1155_summary = _processErc1155Txns(txn_grouped['txn_erc1155'])
-    txn_grouped_enriched.update(erc1155_summary)
 
-    return txn_grouped_enriched
+def enrichTxn(txn_grouped: dict) -> dict:
+    return enrichTxns([txn_grouped])[0]
+
 
+def _lookupContract(address):
+    # Worker processes don't call Etherscan, the parent process resolves the contract as the serial path would
+    contract = _contracts.get(address)
+    if contract is None:
+        if _is_describe_worker:
+            raise _MissingContract(address)
+        contract = getContract(address)
 
-def _timestampLessThan(txn_a, txn_b):
-    return txn_a['timestamp'] < txn_b['timestamp']
+    return contract
 
 
 def _describeNFTs(erc20s, erc721s, erc1155s):
     nft_str_list = []
     for erc20 in erc20s:
-        nft_str_list.append("{:.5f} {}".format(erc20['value'], erc20['symbol']))
+        nft_str_list.append("{:.5f} {}".format(toUnits(erc20['value'], erc20['decimals']), erc20['symbol']))
 
     for erc721 in erc721s:
         nft_str_list.append("{}-{}".format(erc721['symbol'], erc721['id']))
@@ -184,6 +336,44 @@ def _netEthAndGas(txn_normal, txn_internal, my_wallets):
     return ret_data
 
 
+def _tokenAsset(contract):
+    contract = contract.lower()
+    return ASSET_WETH if contract in WETH_CONTRACT else contract
+
+
+def _netTokens(erc20s, my_wallets):
+    # Net amount of each ERC-20 token into (positive) or out of (negative) my wallets, in base units of the token
+    #   transfers between my wallets cancel out
+    tokens = {}
+    for erc20 in erc20s:
+        is_to_mine = erc20['to'] in my_wallets
+        if is_to_mine == (erc20['from'] in my_wallets):
+            continue
+
+        asset = _tokenAsset(erc20['contract'])
+        token = tokens.setdefault(asset, {'asset': asset, 'symbol': erc20['symbol'], 'decimals': erc20['decimals'],
+                                          'amount': 0})
+        token['amount'] += erc20['value'] if is_to_mine else -erc20['value']
+
+    return [token for token in tokens.values() if token['amount']]
+
+
+def _netNfts(erc721s, erc1155s, my_wallets):
+    # Net quantity of each NFT into (positive) or out of (negative) my wallets, by contract and token id
+    #   transfers between my wallets cancel out
+    nfts = {}
+    for nft, quantity in [(t, 1) for t in erc721s] + [(t, t['value']) for t in erc1155s]:
+        is_to_mine = nft['to'] in my_wallets
+        if is_to_mine == (nft['from'] in my_wallets):
+            continue
+
+        key = (nft['contract'].lower(), nft['id'])
+        net_nft = nfts.setdefault(key, {'contract': key[0], 'id': nft['id'], 'symbol': nft['symbol'], 'quantity': 0})
+        net_nft['quantity'] += quantity if is_to_mine else -quantity
+
+    return [net_nft for net_nft in nfts.values() if net_nft['quantity']]
+
+
 def _describeEtherscanTxn(txn, my_wallets):
     has_eth = txn['Normal'] or txn['Internal']
     has_nfts = len(txn['ERC-20'] + txn['ERC-721'] + txn['ERC-1155']) > 0
@@ -195,53 +385,56 @@ def _describeEtherscanTxn(txn, my_wallets):
         gas_data = eth_and_gas['gas']
         addr_from = eth_data['from'].lower()
         addr_to = eth_data['to'].lower()
+        # in ether, for descriptions
+        eth_ether = toUnits(eth_data['amount'])
+        gas_ether = toUnits(gas_data['amount'])
 
         if addr_from in my_wallets and addr_to in my_wallets:
             txn_type = 'transfer'
             describe_str = 'Transfer {:.5f}E from 0x...{} to 0x...{} ' \
-                           'with {:.5f}E gas'.format(eth_data['amount'], addr_from[-5:], addr_to[-5:],
-                                                     gas_data['amount'])
+                           'with {:.5f}E gas'.format(eth_ether, addr_from[-5:], addr_to[-5:],
+                                                     gas_ether)
         # transfer from Coinbase
         elif addr_from in COINBASE_WALLETS and addr_to in my_wallets:
             txn_type = 'transfer_from_coinbase'
             describe_str = 'Transfer {:.5f}E from Coinbase to 0x...{} ' \
-                           'with {:.5f}E gas'.format(eth_data['amount'], addr_to[-5:], gas_data['amount'])
+                           'with {:.5f}E gas'.format(eth_ether, addr_to[-5:], gas_ether)
         # transfer back to Coinbase
         elif addr_to in COINBASE_WALLETS:
             txn_type = 'transfer_to_coinbase'
             describe_str = 'Transfer {:.5f}E from 0x...{} to Coinbase ' \
-                           'with {:.5f}E gas'.format(eth_data['amount'], addr_from[-5:], gas_data['amount'])
+                           'with {:.5f}E gas'.format(eth_ether, addr_from[-5:], gas_ether)
         # Transfer via Ronin bridge
         elif addr_to in RONIN_BRIDGE:
             txn_type = 'transfer_to_ronin'
             describe_str = 'Transfer {:.5f}E from 0x...{} to Ronin ' \
-                           'with {:.5f}E gas'.format(eth_data['amount'], addr_from[-5:], gas_data['amount'])
+                           'with {:.5f}E gas'.format(eth_ether, addr_from[-5:], gas_ether)
         # Transfer via Ronin bridge
         elif addr_to in POLYGON_BRIDGE:
             txn_type = 'transfer_to_polygon'
             describe_str = 'Transfer {:.5f}E from 0x...{} to Polygon ' \
-                           'with {:.5f}E gas'.format(eth_data['amount'], addr_from[-5:], gas_data['amount'])
+                           'with {:.5f}E gas'.format(eth_ether, addr_from[-5:], gas_ether)
         # ETH from my address, and no NFTs involved
         elif addr_from in my_wallets:
-            contract = getContract(addr_to)
+            contract = _lookupContract(addr_to)
 
             if isContract(contract):
                 func_name = findFunction(contract, txn['txn_normal'][0]['input'])
 
                 if txn['txn_normal'][0]['isError'] == '1':
                     txn_type = 'failed_txn'
-                    describe_str = 'Function {} failed with {:.5f}E gas'.format(func_name, gas_data['amount'])
+                    describe_str = 'Function {} failed with {:.5f}E gas'.format(func_name, gas_ether)
 
                 elif addr_to in WETH_CONTRACT and func_name != 'approve':
                     match func_name:
                         case 'deposit':
                             txn_type = 'wrap_ETH'
-                            describe_str = 'Wrap {:.5f}E to WETH with {:.5f}E gas'.format(eth_data['amount'],
-                                                                                          gas_data['amount'])
+                            describe_str = 'Wrap {:.5f}E to WETH with {:.5f}E gas'.format(eth_ether,
+                                                                                          gas_ether)
                         case 'withdraw':
                             txn_type = 'unwrap_ETH'
-                            describe_str = 'Unwrap {:.5f}E WETH with {:.5f}E gas'.format(eth_data['amount'],
-                                                                                         gas_data['amount'])
+                            describe_str = 'Unwrap {:.5f}E WETH with {:.5f}E gas'.format(eth_ether,
+                                                                                         gas_ether)
 
                         case _:
                             raise Exception('Unknown interaction (function {}) with WETH contract'.format(func_name))
@@ -252,30 +445,30 @@ def _describeEtherscanTxn(txn, my_wallets):
                         case 'registerProxy' | 'cancelOrder_' | 'joinWhitelist' | 'bid':
                             txn_type = 'misc_expense'  # Approve wallet
                             describe_str = 'Function {} cost {:.5f}E ' \
-                                           'with {:.5f}E gas'.format(func_name, eth_data['amount'], gas_data['amount'])
+                                           'with {:.5f}E gas'.format(func_name, eth_ether, gas_ether)
 
                         case 'setApprovalForAll' | 'approve':
                             txn_type = 'approve_contract'  # Approve contract
                             describe_str = 'Approving {} contract with {:.5f}E gas'.format(contract['ContractName'],
-                                                                                           gas_data['amount'])
+                                                                                           gas_ether)
                         case 'takingTickets':
                             txn_type = 'gift'  # Buy raffle tickets
-                            describe_str = 'Pay {:.5f}E to enter raffle with {:.5f}E gas'.format(eth_data['amount'],
-                                                                                                 gas_data['amount'])
+                            describe_str = 'Pay {:.5f}E to enter raffle with {:.5f}E gas'.format(eth_ether,
+                                                                                                 gas_ether)
                         case _:
                             raise Exception('Unknown interaction (function {}) '
                                             'with {} contract {}'.format(func_name, contract['name'], addr_to[-5:]))
 
             else:
                 txn_type = 'gift'
-                describe_str = 'Gift {:.5f}E to 0x...{} with {:.5f}E gas '.format(eth_data['amount'], addr_to[-5:],
-                                                                                  gas_data['amount'])
+                describe_str = 'Gift {:.5f}E to 0x...{} with {:.5f}E gas '.format(eth_ether, addr_to[-5:],
+                                                                                  gas_ether)
         # ETH to my wallet, and no NFTs involved
         elif addr_to in my_wallets:
             txn_type = 'receive_gift'
-            describe_str = 'Receive {:.5f}E from 0x...{}'.format(eth_data['amount'], addr_from[-5:])
+            describe_str = 'Receive {:.5f}E from 0x...{}'.format(eth_ether, addr_from[-5:])
             if gas_data['amount']:
-                describe_str += ' with {:.5f}E gas'.format(gas_data['amount'])
+                describe_str += ' with {:.5f}E gas'.format(gas_ether)
 
         else:
             raise Exception('Unknown ETH transaction with no owned wallets involved {}'.format(txn['txn_hash']))
@@ -332,12 +525,14 @@ def _describeEtherscanTxn(txn, my_wallets):
             gas_data = eth_and_gas['gas']
             addr_from = eth_data['from'].lower()
             addr_to = eth_data['to'].lower()
+            eth_ether = toUnits(eth_data['amount'])
+            gas_ether = toUnits(gas_data['amount'])
 
             # ETH from wallet, pay to buy NFT
             if addr_from in my_wallets:
                 # pay, but not receiving all NFTs
                 if any([addr not in my_wallets for addr in nft_tos]):
-                    contract = getContract(addr_to)
+                    contract = _lookupContract(addr_to)
                     # exchange via contract functions
                     if isContract(contract):
                         func_name = findFunction(contract, txn['txn_normal'][0]['input'])
@@ -352,8 +547,8 @@ def _describeEtherscanTxn(txn, my_wallets):
                         if not nft_to_str:
                             txn_type = 'send_nft'
                             describe_str = '{} {} with {:.5f}E with {:.5f}E gas'.format(func_name, nft_from_str,
-                                                                                        eth_data['amount'],
-                                                                                        gas_data['amount'])
+                                                                                        eth_ether,
+                                                                                        gas_ether)
                         # no NFT sent, not possible in this branch
                         elif not nft_from_str:
                             raise Exception('Unknown ETH and NFT exchange')
@@ -363,20 +558,20 @@ def _describeEtherscanTxn(txn, my_wallets):
                             txn_type = 'exchange'
                             describe_str = '{} {} for {} + {:.5f}E with {:.5f}E gas'.format(func_name,
                                                                                             nft_to_str, nft_from_str,
-                                                                                            eth_data['amount'],
-                                                                                            gas_data['amount'])
+                                                                                            eth_ether,
+                                                                                            gas_ether)
                     # Pay to burn
                     elif all([addr in BURN_ADDRESSES for addr in nft_tos]):
                         txn_type = 'burn_nft'
-                        describe_str = 'Burn {} for {:.5f}E with {:.5f}E gas'.format(nft_str, eth_data['amount'],
-                                                                                     gas_data['amount'])
+                        describe_str = 'Burn {} for {:.5f}E with {:.5f}E gas'.format(nft_str, eth_ether,
+                                                                                     gas_ether)
                     else:
                         raise Exception('unknown method of exchanging NFTs')
                 # Pay, received all NFTs
                 else:
                     txn_type = 'buy_nft'
                     describe_str = 'Buy {} for {:.5f}E with {:.5f}E gas'.format(nft_str,
-                                                                                eth_data['amount'], gas_data['amount'])
+                                                                                eth_ether, gas_ether)
             # ETH to wallet, receive from NFT sale
             elif addr_to in my_wallets:
                 # Some NFTs not originated from my wallets
@@ -385,7 +580,7 @@ def _describeEtherscanTxn(txn, my_wallets):
 
                 txn_type = 'sell_nft'
                 describe_str = 'Sell {} for {:.5f}E with {:.5f}E gas'.format(nft_str,
-                                                                             eth_data['amount'], gas_data['amount'])
+                                                                             eth_ether, gas_ether)
             # my wallets not involved, not expected transaction
             else:
                 raise Exception('Unknown NFT ({}) transaction '
@@ -396,11 +591,19 @@ def _describeEtherscanTxn(txn, my_wallets):
 
     assert ('ETH' not in eth_data) or (eth_data['ETH']['from'] in my_wallets)
 
-    print(describe_str)
+    tokens = _netTokens(txn['ERC-20'], my_wallets)
+    # WETH minted or burned by the WETH contract is not an ERC-20 transfer, it follows the ETH wrapped or unwrapped
+    if txn_type == 'wrap_ETH':
+        tokens.append({'asset': ASSET_WETH, 'symbol': 'WETH', 'decimals': WEI_DECIMALS, 'amount': eth_data['amount']})
+    elif txn_type == 'unwrap_ETH':
+        tokens.append({'asset': ASSET_WETH, 'symbol': 'WETH', 'decimals': WEI_DECIMALS, 'amount': -eth_data['amount']})
+
     return {
         'type': txn_type,
         'ETH': eth_data,
         'gas': gas_data,
+        'tokens': tokens,
+        'nfts': _netNfts(txn['ERC-721'], txn['ERC-1155'], my_wallets),
         'NFTs': {
             'ERC-20': txn['ERC-20'],
             'ERC-721': txn['ERC-721'],
@@ -442,24 +645,26 @@ def _describeCoinbaseTxn(txn, asset, my_wallets):
 
         # TODO: this should have been created in an enrichment step, not description
         eth_data = {
-            'amount': float(txn['Quantity Transacted']),
+            'amount': parseUnits(txn['Quantity Transacted']),
             'to': addr_target
         }
         # transfer fee is baked in
         gas_data = {'amount': 0}
+        eth_ether = toUnits(eth_data['amount'])
 
         if is_gift:
-            describe_str = 'Gift {:.5f}E from Coinbase to 0x...{}'.format(eth_data['amount'], addr_target[-5:])
+            describe_str = 'Gift {:.5f}E from Coinbase to 0x...{}'.format(eth_ether, addr_target[-5:])
         elif is_transfer:
-            describe_str = 'Transfer {:.5f}E from Coinbase to 0x...{}'.format(eth_data['amount'], addr_target[-5:])
+            describe_str = 'Transfer {:.5f}E from Coinbase to 0x...{}'.format(eth_ether, addr_target[-5:])
         else:
-            describe_str = 'Buy {:.5f}E'.format(eth_data['amount'])
+            describe_str = 'Buy {:.5f}E'.format(eth_ether)
 
-        print(describe_str)
         return {
             'type': txn_type,
             'ETH': eth_data,
             'gas': gas_data,
+            'tokens': [],
+            'nfts': [],
             'description': describe_str,
             'timestamp': txn['timestamp'],
             'id': ''
@@ -467,11 +672,12 @@ def _describeCoinbaseTxn(txn, asset, my_wallets):
     elif txn_type_raw == 'convert':
         notes_items = txn['Notes'].split()
         if notes_items[-1].lower() == asset:
-            print(txn['Notes'])
             return {
                 'type': 'buy',
-                'ETH': {'amount': float(notes_items[-2]), 'to': ''},
+                'ETH': {'amount': parseUnits(notes_items[-2]), 'to': ''},
                 'gas': {'amount': 0},
+                'tokens': [],
+                'nfts': [],
                 'description': txn['Notes'],
                 'timestamp': txn['timestamp'],
                 'id': ''
@@ -482,37 +688,103 @@ def _describeCoinbaseTxn(txn, asset, my_wallets):
         return {}
 
 
-def describeEthTxns(coinbase_txns, etherscan_txns, my_wallets):
+def _chunkContracts(etherscan_txns, contracts) -> dict:
+    # Contracts already resolved that transactions of a chunk may look up, by address called
+    addresses = {t['to'].lower() for txn in etherscan_txns for t in txn['txn_normal'] + txn['txn_internal']}
+    return {address: contracts[address] for address in addresses if address in contracts}
+
+
+def _initDescribeWorker():
+    # contract cache on disk and Etherscan calls stay with the parent process
+    global _is_describe_worker
+    _is_describe_worker = True
+    etherscanIO.contract_db = None
+
+
+def _describeEtherscanChunk(etherscan_txns, my_wallets, contracts):
+    # Runs in a worker process, descriptions up to the first failure are returned along with it
+    global _contracts
+    _contracts = contracts
+
+    descriptions = []
+    try:
+        for txn in etherscan_txns:
+            descriptions.append(_describeEtherscanTxn(txn, my_wallets))
+    except Exception as e:
+        return descriptions, e
+
+    return descriptions, None
+
+
+def _iterDescribeEtherscanTxnsParallel(etherscan_txns, my_wallets, max_workers=None, chunk_size=DESCRIBE_CHUNK_SIZE):
+    # Describe chunks of transactions in worker processes, with the contracts this process resolved so far
+    #   a worker stops at a contract not resolved yet, it is resolved by this process when the chunk is next in
+    #   order, just as the serial path looks it up, and the rest of the chunk is described again
+    #   a bounded number of chunks is in flight, results are yielded in the order of transactions
+    max_workers = max_workers or os.cpu_count()
+    etherscan_txns = iter(etherscan_txns)
+    contracts = {}
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_initDescribeWorker) as executor:
+        def submitChunk(txns):
+            return txns, executor.submit(_describeEtherscanChunk, txns, my_wallets, _chunkContracts(txns, contracts))
+
+        pending_chunks = collections.deque()
+        while True:
+            while len(pending_chunks) < 2 * max_workers:
+                txns = list(itertools.islice(etherscan_txns, chunk_size))
+                if not txns:
+                    break
+                pending_chunks.append(submitChunk(txns))
+
+            if not pending_chunks:
+                return
+
+            txns, future = pending_chunks.popleft()
+            descriptions, error = future.result()
+            for txn, description in zip(txns, descriptions):
+                yield txn['timestamp'], description
+            if isinstance(error, _MissingContract):
+                contracts[error.address] = getContract(error.address)
+                pending_chunks.appendleft(submitChunk(txns[len(descriptions):]))
+            elif error is not None:
+                raise error
+
+
+def _descriptionRecord(description):
+    return {
+        'timestamp': description['timestamp'],
+        'txn_hash': description.get('txn_hash', ''),
+        'type': description['type'],
+        'eth_amount': formatUnits(description['ETH'].get('amount', 0)),
+        'gas_amount': formatUnits(description['gas'].get('amount', 0)),
+        'description': description['description'],
+    }
+
+
+def iterDescribeEthTxns(coinbase_txns, etherscan_txns, my_wallets, parallel=False, max_workers=None):
+    # Describe two streams of transactions, each in ascending timestamp order, as one stream in timestamp order
+    #   on equal timestamps the etherscan transaction comes first
+    #   in parallel, etherscan transactions are described across processes, with the same result
+    if parallel:
+        etherscan_descriptions = _iterDescribeEtherscanTxnsParallel(etherscan_txns, my_wallets, max_workers)
+    else:
+        etherscan_descriptions = ((txn['timestamp'], _describeEtherscanTxn(txn, my_wallets))
+                                  for txn in etherscan_txns)
+    coinbase_descriptions = ((txn['timestamp'], _describeCoinbaseTxn(txn, ASSET_ETH, my_wallets))
+                             for txn in coinbase_txns)
+
+    for _, description in heapq.merge(etherscan_descriptions, coinbase_descriptions, key=lambda item: item[0]):
+        # skip empty transactions, not relevant to ETH
+        if description:
+            reportWriter.emit('descriptions', _descriptionRecord(description), description['description'])
+            yield description
+
+
+def describeEthTxns(coinbase_txns, etherscan_txns, my_wallets, parallel=False, max_workers=None):
     def sortByTimestamp(x):
         return x['timestamp']
 
     # the oldest to the latest transactions by timestamp
     coinbase_txns.sort(key=sortByTimestamp)
     etherscan_txns.sort(key=sortByTimestamp)
-    eth_descriptions = []
-
-    i = j = 0
-    max_i = len(coinbase_txns) - 1
-    max_j = len(etherscan_txns) - 1
-    # Iterate over two list of transactions, by ascending timestamp in both lists
-    while i <= max_i or j <= max_j:
-        # if exhausted etherscan txns
-        if j > max_j:
-            eth_descriptions.append(_describeCoinbaseTxn(coinbase_txns[i], "ETH", my_wallets))
-            i += 1
-        # if exhausted coinbase txns
-        elif i > max_i:
-            eth_descriptions.append(_describeEtherscanTxn(etherscan_txns[j], my_wallets))
-            j += 1
-        # if coinbase txn timestamp earlier (smaller)
-        elif _timestampLessThan(coinbase_txns[i], etherscan_txns[j]):
-            eth_descriptions.append(_describeCoinbaseTxn(coinbase_txns[i], "ETH", my_wallets))
-            i += 1
-        # else - etherscan txn timestamp earlier (smaller)
-        else:
-            eth_descriptions.append(_describeEtherscanTxn(etherscan_txns[j], my_wallets))
-            j += 1
-
-    # remove empty transactions, not relevant to ETH
-    eth_descriptions = [x for x in eth_descriptions if x]
-    return eth_descriptions
+    return list(iterDescribeEthTxns(coinbase_txns, etherscan_txns, my_wallets, parallel, max_workers))